@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Subject, Course, Module
+from django.utils import timezone
+from .models import Subject, Course, Module, Task
+from .search import search_course_ids
 
 
 @admin.register(Subject)
@@ -8,8 +10,11 @@ class SubjectAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
 
 
+# the version is incremented by every save (see signals.module_version),
+# it's shown but can't be set here
 class ModuleInline(admin.StackedInline):
     model = Module
+    readonly_fields = ['version']
 
 
 @admin.register(Course)
@@ -20,5 +25,33 @@ class CourseAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ModuleInline]
 
-
-admin.site.register(Module)
+    # use the search index (words starting with the terms) instead of LIKE
+    # scans over title and overview, LIKE only when the index has no match
+    # (e.g. a search for part of a word)
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        course_ids = search_course_ids(search_term)
+        if not course_ids:
+            return super(CourseAdmin, self).get_search_results(request, queryset,
+                                                               search_term)
+        return queryset.filter(id__in=course_ids), False
+
+
+@admin.register(Module)
+class ModuleAdmin(admin.ModelAdmin):
+    readonly_fields = ['version']
+
+
+# queued and failed background tasks, failed ones can be queued again
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_at', 'created']
+    list_filter = ['status', 'name']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        queryset.filter(status=Task.FAILED).update(status=Task.QUEUED,
+                                                   attempts=0,
+                                                   run_at=timezone.now())
+    retry.short_description = 'Queue selected failed tasks again'
@@ -3,3 +3,15 @@ from django.apps import AppConfig
 
 class CoursesConfig(AppConfig):
     name = 'courses'
+
+    def ready(self):
+        from .models import Text, Video, Image, File
+        from .registry import registry
+        # connect receivers
+        from . import signals
+        from . import db
+        # register background tasks run by workers
+        from . import blobs, deletion, derivatives, uploads
+        # content types available in modules
+        for model in (Text, Video, Image, File):
+            registry.register(model)
@@ -0,0 +1,97 @@
+from uuid import uuid4
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+PERMISSIONS_TIMEOUT = getattr(settings, 'PERMISSIONS_CACHE_TIMEOUT', 60 * 60)
+USER_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 5 * 60)
+# changed when permissions of groups change, keys of all users then differ;
+# random so entries from before an eviction of the generation are not reused
+PERMISSIONS_GENERATION_KEY = 'permissions:generation'
+
+
+def get_permissions_generation():
+    generation = cache.get(PERMISSIONS_GENERATION_KEY)
+    if generation is None:
+        generation = uuid4().hex
+        cache.add(PERMISSIONS_GENERATION_KEY, generation, None)
+        # another process may have added it first
+        generation = cache.get(PERMISSIONS_GENERATION_KEY) or generation
+    return generation
+
+
+def permissions_key(user_id, from_name, generation):
+    return 'permissions:{}:{}:{}'.format(generation, from_name, user_id)
+
+
+def user_key(user_id):
+    return 'auth_user:{}'.format(user_id)
+
+
+# ModelBackend with the user of a session and the resolved permissions of
+# users kept in cache, so requests don't query the user and
+# permission_required views its permissions and groups every time.
+# Signals drop the entries when permissions, groups or the user change
+# and on logout (see courses.signals)
+class CachedModelBackend(ModelBackend):
+    # AuthenticationMiddleware loads request.user with this
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super(CachedModelBackend, self).get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, USER_TIMEOUT)
+        return user
+
+    def _get_permissions(self, user_obj, obj, from_name):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        perm_cache_name = '_%s_perm_cache' % from_name
+        if not hasattr(user_obj, perm_cache_name):
+            key = permissions_key(user_obj.id, from_name,
+                                  get_permissions_generation())
+            perms = cache.get(key)
+            if perms is None:
+                perms = super(CachedModelBackend, self)._get_permissions(
+                    user_obj, obj, from_name)
+                cache.set(key, perms, PERMISSIONS_TIMEOUT)
+            setattr(user_obj, perm_cache_name, perms)
+        return getattr(user_obj, perm_cache_name)
+
+
+# drop cached users, now and after commit
+def invalidate_users(user_ids):
+    keys = [user_key(user_id) for user_id in set(user_ids)]
+
+    def invalidate():
+        cache.delete_many(keys)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+# drop cached permissions, now and after commit
+def invalidate_permissions(user_ids):
+    user_ids = set(user_ids)
+
+    def invalidate():
+        generation = get_permissions_generation()
+        cache.delete_many([permissions_key(user_id, from_name, generation)
+                           for user_id in user_ids
+                           for from_name in ('user', 'group')])
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+# permissions of a group (or a deleted permission) can concern any user
+def invalidate_all_permissions():
+    def invalidate():
+        cache.set(PERMISSIONS_GENERATION_KEY, uuid4().hex, None)
+
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from .registry import registry
+from .storage import ContentAddressedStorage, blob_storage
+from .tasks import enqueue, task
+
+
+# (model, field name) of every registered content field stored as blobs
+def blob_fields():
+    return [(model, field.name)
+            for model in registry.models()
+            for field in model._meta.fields
+            if isinstance(field, models.FileField) and
+            isinstance(field.storage, ContentAddressedStorage)]
+
+
+# derivative names are hashes of their data, so images sharing
+# a blob share derivative files too
+def derivative_fields():
+    from .models import ImageDerivative
+    return [(ImageDerivative, 'file')]
+
+
+# files which can be shared by rows: their storage and the fields using them
+def get_file_group(group):
+    if group == 'blobs':
+        return blob_storage, blob_fields()
+    if group == 'derivatives':
+        fields = derivative_fields()
+        model, field_name = fields[0]
+        return model._meta.get_field(field_name).storage, fields
+    raise ValueError('Unknown file group {}'.format(group))
+
+
+# how many rows use each of the names, one query per field
+def count_references(names, fields=None):
+    if fields is None:
+        fields = blob_fields()
+    names = set(names)
+    counts = dict.fromkeys(names, 0)
+    for model, field_name in fields:
+        rows = model.objects.filter(**{'{}__in'.format(field_name): names}) \
+                            .values(field_name) \
+                            .annotate(references=models.Count('id')) \
+                            .values_list(field_name, 'references')
+        for name, references in rows:
+            counts[name] += references
+    return counts
+
+
+# delete files which are not referenced by any row anymore
+# files saved or reused during the grace period (seconds) are kept,
+# the row using them may not be committed yet
+@task('collect_blobs')
+def collect_blobs(names, grace_period=None, group='blobs'):
+    if grace_period is None:
+        grace_period = getattr(settings, 'BLOB_GRACE_PERIOD', 60)
+    storage, fields = get_file_group(group)
+    names = [name for name in set(names) if name and storage.exists(name)]
+    if not names:
+        return []
+    recent = timezone.now() - timedelta(seconds=grace_period)
+    deleted = []
+    for name, references in count_references(names, fields).items():
+        if references == 0 and storage.get_modified_time(name) < recent:
+            storage.delete(name)
+            deleted.append(name)
+    return deleted
+
+
+# rows stopped using these files, a task queued in the same transaction
+# deletes them when no other row uses them. It runs after the grace period,
+# so files stored just before (e.g. by a failed import) are collected too
+def release_blobs(names, group='blobs'):
+    names = sorted(set(name for name in names if name))
+    if names:
+        enqueue('collect_blobs', {'names': names, 'group': group},
+                priority=-1, delay=getattr(settings, 'BLOB_GRACE_PERIOD', 60))
@@ -0,0 +1,34 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+# the public catalog (subjects, course lists) has one modification time,
+# set when a subject, course or module changes; it is used as Last-Modified
+# and ETag of the catalog pages and in keys of their cached fragments
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+
+# last change of the catalog, now when the cached value was evicted
+def get_catalog_modified():
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        now = timezone.now()
+        cache.add(CATALOG_MODIFIED_KEY, now, None)
+        # another process may have added it first
+        modified = cache.get(CATALOG_MODIFIED_KEY) or now
+    return modified
+
+
+def get_catalog_version():
+    return get_catalog_modified().strftime('%Y%m%d%H%M%S%f')
+
+
+# set now and once more after commit, pages rendered inside the
+# transaction may have cached fragments with old data
+def touch_catalog():
+    def touch():
+        cache.set(CATALOG_MODIFIED_KEY, timezone.now(), None)
+
+    touch()
+    transaction.on_commit(touch)
@@ -0,0 +1,106 @@
+import random
+from contextvars import ContextVar
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .middleware import SyncAsyncMiddleware
+
+
+# True when the current request (or thread) wrote to the primary, its
+# later reads go to the primary too, so it reads its own writes
+_pinned = ContextVar('courses_db_pinned', default=False)
+
+
+# sync_to_async for read-only calls of async views: Django 3.1 runs every
+# thread sensitive call in one thread for the whole process, reads run in
+# the executor instead so requests don't wait for each other. Tests keep
+# them in one thread (ASYNC_READS_THREAD_SENSITIVE), the data of a test
+# case is only visible in its transaction
+def read_to_async(func):
+    return sync_to_async(func, thread_sensitive=getattr(
+        settings, 'ASYNC_READS_THREAD_SENSITIVE', False))
+
+
+# pragmas for SQLite connections: WAL lets readers run while one writer
+# commits (the rollback journal locks the whole file), busy_timeout makes
+# writers wait for the lock instead of failing with "database is locked"
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+# persistent connections (CONN_MAX_AGE) are reused by the next requests,
+# Django older than 4.1 checks them only after an error, here every reused
+# connection is checked when a request starts (CONN_HEALTH_CHECKS)
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    for connection in connections.all():
+        if connection.connection is None or \
+                not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+# reads of models of DATABASE_ROUTER_APPS go to a random replica alias
+# (DATABASE_REPLICAS), writes and everything else to the primary. After
+# the first write of a request its reads stay on the primary, replicas
+# may lag behind it
+class PrimaryReplicaRouter(object):
+    primary = 'default'
+
+    def get_replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def is_routed(self, model):
+        return model._meta.app_label in getattr(settings, 'DATABASE_ROUTER_APPS',
+                                                ['courses'])
+
+    def db_for_read(self, model, **hints):
+        replicas = self.get_replicas()
+        if not replicas or _pinned.get() or not self.is_routed(model):
+            return self.primary
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return self.primary
+
+    # replicas hold the same data as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = [self.primary] + list(self.get_replicas())
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == self.primary
+
+
+# every request starts unpinned; unsafe requests (POST, PUT, ...) read from
+# the primary from the start, their reads usually decide what is written
+class DatabaseRoutingMiddleware(SyncAsyncMiddleware):
+    def pin(self, request):
+        return _pinned.set(request.method not in ('GET', 'HEAD', 'OPTIONS'))
+
+    def call(self, request):
+        token = self.pin(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _pinned.reset(token)
+
+    async def acall(self, request):
+        token = self.pin(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _pinned.reset(token)
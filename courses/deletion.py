@@ -0,0 +1,149 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, router, transaction
+from .blobs import blob_fields, release_blobs
+from .models import Course, Module, Content, Text
+from .outline import invalidate_course_outline
+from .tasks import enqueue, task
+from . import search
+
+
+# ids per DELETE statement, below the SQLite limit of query parameters
+BATCH_SIZE = 500
+
+
+def batches(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# names of files stored in "field_names" of the rows with given ids
+def get_file_names(model, ids, field_names):
+    names = []
+    for batch in batches(ids):
+        for row in model.objects.filter(id__in=batch).values_list(*field_names):
+            names.extend(row)
+    return names
+
+
+# delete rows with plain batched DELETE statements, signals are not sent
+# (callers take care of caches and files) so rows are never loaded
+def raw_delete(model, ids, using):
+    deleted = 0
+    for batch in batches(ids):
+        deleted += model._base_manager.using(using) \
+                        .filter(id__in=batch)._raw_delete(using)
+    return deleted
+
+
+# delete items (text/video/image/file) with rows depending on them
+# (e.g. image derivatives), files are released for cleanup after commit
+def delete_items(model, ids, using=None):
+    ids = set(ids)
+    if not ids:
+        return 0
+    using = using or router.db_for_write(model)
+    blob_names = get_file_names(model, ids, [name for item_model, name in blob_fields()
+                                             if item_model is model])
+    with transaction.atomic(using=using):
+        for relation in model._meta.related_objects:
+            if relation.on_delete is not models.CASCADE or relation.many_to_many:
+                continue
+            related = relation.related_model
+            file_names = [field.name for field in related._meta.fields
+                          if isinstance(field, models.FileField)]
+            related_ids = []
+            for batch in batches(ids):
+                related_ids.extend(related._base_manager.using(using)
+                                          .filter(**{'{}__in'.format(relation.field.name): batch})
+                                          .values_list('id', flat=True))
+            if file_names:
+                release_blobs(get_file_names(related, related_ids, file_names),
+                              group='derivatives')
+            raw_delete(related, related_ids, using)
+        deleted = raw_delete(model, ids, using)
+    release_blobs(blob_names)
+    return deleted
+
+
+# ids of the items (of one content type) bound to contents
+def get_used_items(content_type_id, object_ids, using=None):
+    used = set()
+    for batch in batches(object_ids):
+        used.update(Content.objects.using(using)
+                           .filter(content_type_id=content_type_id,
+                                   object_id__in=batch)
+                           .values_list('object_id', flat=True))
+    return used
+
+
+# items of deleted contents, unless they were bound to a content since
+@task('delete_items')
+def delete_unused_items(content_type_id, object_ids):
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        delete_items(model, set(object_ids) - get_used_items(content_type_id,
+                                                             object_ids, using),
+                     using)
+
+
+# delete contents and the items bound to them with a few set based queries:
+# one to read the contents, one per content type to find items still used
+# by other contents, and batched DELETEs, all in one transaction.
+# With defer_items the items (and their files) are deleted by a task,
+# the contents are gone from the modules right away
+def delete_contents(contents, defer_items=False):
+    using = router.db_for_write(Content)
+    with transaction.atomic(using=using):
+        rows = list(contents.values_list('id', 'module_id',
+                                         'content_type_id', 'object_id'))
+        if not rows:
+            return 0
+        items = {}
+        for id, module_id, content_type_id, object_id in rows:
+            items.setdefault(content_type_id, set()).add(object_id)
+        deleted = raw_delete(Content, [row[0] for row in rows], using)
+
+        for content_type_id, object_ids in items.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if defer_items:
+                enqueue('delete_items', {'content_type_id': content_type_id,
+                                         'object_ids': sorted(object_ids)})
+            else:
+                # items can be bound to more than one content
+                delete_items(model, object_ids - get_used_items(content_type_id,
+                                                                object_ids, using),
+                             using)
+            if model is Text:
+                # removed from the search index or indexed again for remaining courses
+                search.reindex('text', object_ids)
+
+        module_ids = set(row[1] for row in rows)
+        course_ids = Module.objects.using(using) \
+                                   .filter(id__in=module_ids) \
+                                   .values_list('course_id', flat=True)
+        invalidate_course_outline(course_ids)
+    return deleted
+
+
+# modules with their contents and items
+def delete_modules(modules, defer_items=False):
+    using = router.db_for_write(Module)
+    with transaction.atomic(using=using):
+        module_ids = list(modules.values_list('id', flat=True))
+        delete_contents(Content.objects.filter(module_id__in=module_ids),
+                        defer_items)
+        for batch in batches(module_ids):
+            Module.objects.filter(id__in=batch).delete()
+
+
+# courses with their modules, contents and items
+def delete_courses(courses, defer_items=False):
+    using = router.db_for_write(Course)
+    with transaction.atomic(using=using):
+        course_ids = list(courses.values_list('id', flat=True))
+        delete_modules(Module.objects.filter(course_id__in=course_ids),
+                       defer_items)
+        for batch in batches(course_ids):
+            Course.objects.filter(id__in=batch).delete()
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, IntegrityError
+from .blobs import release_blobs
+from .models import Image, ImageDerivative
+from .tasks import enqueue, task
+
+
+# variants generated for images, the largest side is at most "size"
+VARIANTS = getattr(settings, 'IMAGE_VARIANTS', {
+    'thumbnail': {'size': (200, 200), 'format': 'JPEG', 'quality': 80},
+    'medium': {'size': (800, 800), 'format': 'JPEG', 'quality': 85},
+    'webp': {'size': (1600, 1600), 'format': 'WEBP', 'quality': 80},
+})
+# threads generating derivatives in one process
+MAX_WORKERS = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+_executor = None
+_lock = threading.RLock()
+# futures of derivatives being generated, one per (image id, variant)
+_inflight = {}
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                           thread_name_prefix='image-derivatives')
+        return _executor
+
+
+def is_fresh(derivative, image):
+    return derivative is not None and \
+        derivative.source_updated == image.updated
+
+
+# resize and encode the image, the name contains a hash of the result
+def render_variant(image, variant):
+    from PIL import Image as PILImage
+
+    options = VARIANTS[variant]
+    with image.image.open('rb') as f:
+        picture = PILImage.open(f)
+        picture.load()
+    picture.thumbnail(options['size'])
+    if options['format'] == 'JPEG' and picture.mode != 'RGB':
+        picture = picture.convert('RGB')
+    buffer = BytesIO()
+    picture.save(buffer, options['format'],
+                 quality=options.get('quality', 85), optimize=True)
+    data = buffer.getvalue()
+
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    name = '{}.{}.{}.{}'.format(stem, variant,
+                                hashlib.sha256(data).hexdigest()[:16],
+                                EXTENSIONS[options['format']])
+    return ContentFile(data, name=name)
+
+
+def generate_derivative(image_id, variant):
+    image = Image.objects.get(id=image_id)
+    derivative = ImageDerivative.objects.filter(image=image,
+                                                variant=variant).first()
+    if is_fresh(derivative, image):
+        return derivative
+
+    content = render_variant(image, variant)
+    field = ImageDerivative._meta.get_field('file')
+    name = field.generate_filename(None, content.name)
+    # same data gives the same name, don't store it twice
+    if not field.storage.exists(name):
+        name = field.storage.save(name, content)
+    old_name = derivative.file.name if derivative is not None else None
+    try:
+        derivative, created = ImageDerivative.objects.update_or_create(
+            image=image, variant=variant,
+            defaults={'file': name, 'source_updated': image.updated})
+    except IntegrityError:
+        # generated by another process at the same time
+        derivative = ImageDerivative.objects.get(image=image, variant=variant)
+    # the derivative of the previous image data, unless other images use it
+    if old_name and old_name != derivative.file.name:
+        release_blobs([old_name], group='derivatives')
+    return derivative
+
+
+# all variants of a new or changed image, queued when it is saved so the
+# first page showing it doesn't wait for them
+@task('generate_derivatives')
+def generate_derivatives(image_id, variants=None):
+    # deleted since
+    if not Image.objects.filter(id=image_id).exists():
+        return
+    for variant in variants or VARIANTS:
+        generate_derivative(image_id, variant)
+
+
+# generate the variants of a saved image in a worker, queued with the save
+def queue_derivatives(image):
+    enqueue('generate_derivatives', {'image_id': image.id}, priority=1)
+
+
+def _run(image_id, variant):
+    try:
+        return generate_derivative(image_id, variant)
+    finally:
+        # connection of the pool thread
+        connection.close()
+
+
+def _done(key):
+    def callback(future):
+        with _lock:
+            _inflight.pop(key, None)
+    return callback
+
+
+# queue generation in the pool, concurrent requests for the same
+# derivative share one future instead of generating it again
+def submit(image_id, variant):
+    if variant not in VARIANTS:
+        raise ValueError('Unknown variant {}'.format(variant))
+    executor = get_executor()
+    key = (image_id, variant)
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = executor.submit(_run, image_id, variant)
+            _inflight[key] = future
+            future.add_done_callback(_done(key))
+    return future
+
+
+# derivative of an image, generated on first request
+def get_derivative(image, variant, timeout=None):
+    if variant not in VARIANTS:
+        raise ValueError('Unknown variant {}'.format(variant))
+    derivative = ImageDerivative.objects.filter(image=image,
+                                                variant=variant).first()
+    if is_fresh(derivative, image):
+        return derivative
+    return submit(image.id, variant).result(timeout=timeout)
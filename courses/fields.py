@@ -1,30 +1,156 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from collections import OrderedDict
+from django.apps import apps
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Max
+from django.db.models.fields.related import lazy_related_operation
+from django.db.models.signals import post_delete, post_save
 
 
 # this helps to order objects
+# new values come from a counter row per scope (OrderSequence), the counter
+# is incremented with a single UPDATE which locks the row until commit,
+# so concurrent inserts into the same scope never get the same order
 class OrderField(models.PositiveIntegerField):
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super(OrderField, self).__init__(*args, **kwargs)
 
+    # values of the fields in "for_fields", using attnames (course_id)
+    # so related objects are not fetched
+    def scope_values(self, model_instance):
+        return OrderedDict(
+            (self.model._meta.get_field(field).attname,
+             getattr(model_instance,
+                     self.model._meta.get_field(field).attname))
+            for field in self.for_fields or [])
+
+    def scope_key(self, model_instance):
+        return self.make_key(self.scope_values(model_instance).values())
+
+    def make_key(self, values):
+        return '{}.{}:{}'.format(self.model._meta.label_lower,
+                                 self.attname,
+                                 ','.join(str(v) for v in values))
+
+    def get_sequences(self):
+        OrderSequence = apps.get_model('courses', 'OrderSequence')
+        return OrderSequence.objects.using(router.db_for_write(OrderSequence))
+
+    # an explicit order (admin, reorder, bulk insert) may be above the counter
+    # of its scope, the counter is moved past it so new objects don't get an
+    # order already in use; scopes without counter start after Max(order)
+    def bump(self, key, value):
+        self.get_sequences().filter(key=key, value__lte=value) \
+                            .update(value=value + 1)
+
+    # largest written orders by scope, scopes are values of for_fields
+    # (tuples, or single values for one field)
+    def bump_scopes(self, last):
+        for values, value in last.items():
+            values = values if isinstance(values, tuple) else (values,)
+            self.bump(self.make_key(values), value)
+
+    # reserve "count" consecutive values in the scope of model_instance
+    # and return the first one
+    def allocate(self, model_instance, count=1):
+        OrderSequence = apps.get_model('courses', 'OrderSequence')
+        using = router.db_for_write(OrderSequence)
+        sequences = OrderSequence.objects.using(using)
+        key = self.scope_key(model_instance)
+        with transaction.atomic(using=using, savepoint=False):
+            updated = sequences.filter(key=key) \
+                               .update(value=F('value') + count)
+            if not updated:
+                # first allocation in this scope, continue after the
+                # last existing object (index seek on (for_fields, order))
+                qs = self.model._default_manager.using(using) \
+                               .filter(**self.scope_values(model_instance))
+                last = qs.aggregate(last=Max(self.attname))['last']
+                start = 0 if last is None else last + 1
+                try:
+                    with transaction.atomic(using=using):
+                        sequences.create(key=key, value=start + count)
+                    return start
+                except IntegrityError:
+                    # another writer created the counter in the meantime
+                    sequences.filter(key=key) \
+                             .update(value=F('value') + count)
+            value = sequences.filter(key=key) \
+                             .values_list('value', flat=True).get()
+        return value - count
+
+    # give consecutive values to all objects without order,
+    # one counter update for every scope instead of one per object
+    def allocate_bulk(self, objs):
+        scopes = OrderedDict()
+        explicit = {}
+        for obj in objs:
+            value = getattr(obj, self.attname)
+            key = self.scope_key(obj)
+            if value is None:
+                scopes.setdefault(key, []).append(obj)
+            else:
+                explicit[key] = max(value, explicit.get(key, value))
+        for key, value in explicit.items():
+            self.bump(key, value)
+        for group in scopes.values():
+            start = self.allocate(group[0], len(group))
+            for offset, obj in enumerate(group, start):
+                setattr(obj, self.attname, offset)
+        return objs
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
             # no current value
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # filter by objects with the same field values
-                    # for the fields in "for_fields"
-                    query = {field: getattr(model_instance, field) for field in self.for_fields}
-                    qs = qs.filter(**query)
-                # get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
+            value = self.allocate(model_instance)
             setattr(model_instance, self.attname, value)
             return value
         else:
-            return super(OrderField,
-                         self).pre_save(model_instance, add)
+            # checked after save(), bulk_create() doesn't send post_save
+            # and uses allocate_bulk()
+            model_instance._explicit_orders = getattr(
+                model_instance, '_explicit_orders', set()) | {self.attname}
+            return super(OrderField, self).pre_save(model_instance, add)
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(OrderField, self).contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_save.connect(self.saved, sender=cls, weak=False,
+                              dispatch_uid='{}.{}'.format(cls._meta.label_lower, name))
+            # fields of the scope are known once the model is complete
+            lazy_related_operation(self.connect_scope, cls)
+
+    # a scope given by one foreign key (module of contents) ends with the
+    # related object, its counter is deleted with it on every delete path
+    # (ORM, admin, cascades)
+    def connect_scope(self, model):
+        if len(self.for_fields or []) != 1:
+            return
+        field = model._meta.get_field(self.for_fields[0])
+        if field.remote_field is None:
+            return
+
+        def connect(model, scope_model):
+            post_delete.connect(self.scope_deleted, sender=scope_model, weak=False,
+                                dispatch_uid='{}.{}.scope'.format(model._meta.label_lower,
+                                                                  self.name))
+        lazy_related_operation(connect, model, field.remote_field.model)
+
+    def scope_deleted(self, instance, **kwargs):
+        field = self.model._meta.get_field(self.for_fields[0])
+        key = self.make_key([getattr(instance, field.target_field.attname)])
+        self.get_sequences().filter(key=key).delete()
+
+    def saved(self, instance, raw=False, **kwargs):
+        explicit = getattr(instance, '_explicit_orders', set())
+        if self.attname in explicit and not raw:
+            explicit.discard(self.attname)
+            self.bump(self.scope_key(instance), getattr(instance, self.attname))
+
+
+# create objects of a model with an OrderField, orders are reserved
+# per scope first and then all rows are inserted with one bulk_create
+def bulk_create_ordered(model, objs, field_name='order', **kwargs):
+    objs = list(objs)
+    model._meta.get_field(field_name).allocate_bulk(objs)
+    return model._default_manager.bulk_create(objs, **kwargs)
@@ -1,13 +1,182 @@
-from django.forms.models import inlineformset_factory
-from .models import Course, Module
+from django import forms
+from django.db import router, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.forms.models import BaseInlineFormSet, inlineformset_factory
+from .catalog import touch_catalog
+from .deletion import delete_modules
+from .models import Subject, Course, Module
+from .outline import invalidate_course_outline
+from .transfer import bulk_create_with_ids
+from . import search
+
+
+# fields of modules edited in the formset
+MODULE_FIELDS = ['title', 'description']
+
+
+# id of a module of the formset, looked up in its loaded queryset
+class ModuleChoiceField(forms.Field):
+    default_error_messages = {
+        'invalid_choice': 'Select a valid choice. That choice is not one of '
+                          'the available choices.',
+    }
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super(ModuleChoiceField, self).__init__(*args, **kwargs)
+
+    def prepare_value(self, value):
+        return value.pk if isinstance(value, Module) else value
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        module = self.formset._existing_object(Module._meta.pk.to_python(value))
+        if module is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'],
+                                        code='invalid_choice')
+        return module
+
+    def has_changed(self, initial, data):
+        return False
+
+
+# a module was changed or deleted by another editor after the form was sent
+class VersionConflict(Exception):
+    pass
+
+
+# saves only changed modules: changed forms are written with one UPDATE
+# which checks the version of every module (optimistic locking), new modules
+# with one bulk insert and deleted ones with the bulk delete service, all
+# in one transaction
+class BaseModuleFormSet(BaseInlineFormSet):
+    # "conflict": the forms are shown again after save() raised a
+    # VersionConflict, clean() reports it
+    def __init__(self, *args, **kwargs):
+        self.conflict = kwargs.pop('conflict', False)
+        super(BaseModuleFormSet, self).__init__(*args, **kwargs)
+
+    # the modules of the forms are loaded with one query, the default id
+    # field would query every module again while the forms are cleaned
+    def add_fields(self, form, index):
+        super(BaseModuleFormSet, self).add_fields(form, index)
+        form.fields['id'] = ModuleChoiceField(self, initial=form.fields['id'].initial,
+                                              required=False, widget=forms.HiddenInput)
+
+    # versions sent with the forms are compared with the loaded modules,
+    # the UPDATE in save() checks them again for concurrent saves
+    def clean(self):
+        super(BaseModuleFormSet, self).clean()
+        for form in self.initial_forms:
+            if not hasattr(form, 'cleaned_data') or form.instance.pk is None:
+                continue
+            if form in self.deleted_forms or form.has_changed():
+                if form.cleaned_data.get('version') != form.initial.get('version'):
+                    form.add_error(None, 'This module was changed by another '
+                                         'editor, reload the page.')
+        if self.conflict:
+            raise forms.ValidationError('Modules were changed by another editor, '
+                                        'reload the page.')
+
+    def save(self, commit=True):
+        using = router.db_for_write(Module)
+        with transaction.atomic(using=using):
+            self.changed_objects = self.update_changed()
+            self.deleted_objects = self.delete_deleted()
+            self.new_objects = self.create_new()
+        modules = [obj for obj, fields in self.changed_objects] + self.new_objects
+        if modules or self.deleted_objects:
+            invalidate_course_outline([self.instance.id])
+            touch_catalog()
+            search.reindex('module', [module.id for module in modules])
+        return modules
+
+    def update_changed(self):
+        forms = [form for form in self.initial_forms
+                 if form.instance.pk is not None and
+                 form not in self.deleted_forms and form.has_changed()]
+        if not forms:
+            return []
+        condition = Q()
+        for form in forms:
+            condition |= Q(id=form.instance.pk, version=form.cleaned_data['version'])
+        values = {}
+        for field in MODULE_FIELDS:
+            whens = [When(id=form.instance.pk, then=Value(form.cleaned_data[field]))
+                     for form in forms if field in form.changed_data]
+            if whens:
+                values[field] = Case(*whens, default=F(field),
+                                     output_field=Module._meta.get_field(field))
+        updated = Module.objects.filter(condition, course=self.instance) \
+                                .update(version=F('version') + 1, **values)
+        if updated != len(forms):
+            raise VersionConflict('Modules were changed by another editor.')
+        changed = []
+        for form in forms:
+            obj = form.instance
+            for field in MODULE_FIELDS:
+                setattr(obj, field, form.cleaned_data[field])
+            obj.version = form.cleaned_data['version'] + 1
+            changed.append((obj, form.changed_data))
+        return changed
+
+    def delete_deleted(self):
+        forms = [form for form in self.deleted_forms
+                 if form.instance.pk is not None]
+        if not forms:
+            return []
+        condition = Q()
+        for form in forms:
+            condition |= Q(id=form.instance.pk, version=form.cleaned_data['version'])
+        ids = list(Module.objects.filter(condition, course=self.instance)
+                                 .values_list('id', flat=True))
+        if len(ids) != len(forms):
+            raise VersionConflict('Modules were changed by another editor.')
+        delete_modules(Module.objects.filter(id__in=ids))
+        return [form.instance for form in forms]
+
+    def create_new(self):
+        objs = []
+        for form in self.extra_forms:
+            if not form.has_changed() or form in self.deleted_forms:
+                continue
+            obj = form.save(commit=False)
+            obj.course = self.instance
+            objs.append(obj)
+        Module._meta.get_field('order').allocate_bulk(objs)
+        return bulk_create_with_ids(Module, objs)
 
 
 # courses have many modules so we need group of forms
 # here we connect Courses and Modules
 ModuleFormSet = inlineformset_factory(Course,
                                       Module,
+                                      formset=BaseModuleFormSet,
                                       # in fields every variable will be in form
-                                      fields=['title', 'description'],
+                                      fields=MODULE_FIELDS + ['version'],
+                                      widgets={'version': forms.HiddenInput},
                                       # how many empty forms wil be on page
                                       extra=2,
                                       can_delete=True)
+
+
+# course archive made by export (see courses.transfer), subject and slug
+# of the archived course are used when not given
+class CourseImportForm(forms.Form):
+    archive = forms.FileField()
+    subject = forms.ModelChoiceField(queryset=Subject.objects.all(),
+                                     required=False)
+    slug = forms.SlugField(max_length=200, required=False)
+
+
+# title and slug of the copy of a course
+class CourseCloneForm(forms.Form):
+    title = forms.CharField(max_length=200)
+    slug = forms.SlugField(max_length=200)
+
+    def clean_slug(self):
+        slug = self.cleaned_data['slug']
+        if Course.objects.filter(slug=slug).exists():
+            raise forms.ValidationError('Course with this slug already exists.')
+        return slug
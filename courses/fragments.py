@@ -0,0 +1,59 @@
+import hashlib
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+
+FRAGMENT_TIMEOUT = getattr(settings, 'ITEM_FRAGMENT_TIMEOUT', 60 * 60 * 24)
+# rendered in place of {% csrf_token %}, replaced by the token of the request
+# when the fragment is used, so fragments can be shared by all users
+CSRF_PLACEHOLDER = '__fragment_csrf_token__'
+
+
+# content type, id and modification time of an item, from a content of
+# a course outline (dict) or from an item (Text, Video, File, Image, ...)
+def get_item_version(item):
+    if isinstance(item, dict):
+        return item['content_type_id'], item['item_id'], item['updated']
+    content_type = ContentType.objects.get_for_model(item)
+    return content_type.id, item.id, item.updated
+
+
+# the key changes with every save of the item (ItemBase.updated), so old
+# fragments are never read again and expire; "vary" adds other values the
+# fragment depends on (e.g. the content id in links)
+def fragment_key(template_name, item, vary=()):
+    content_type_id, item_id, updated = get_item_version(item)
+    parts = [hashlib.md5(template_name.encode()).hexdigest()[:12],
+             content_type_id, item_id, int(updated.timestamp() * 1000000)]
+    parts.extend(vary)
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+
+# HTML of every item rendered with "template_name" (the item is "item" in
+# its context), in the order of "items". Fragments of all items are read
+# with one get_many, only items changed since they were cached are rendered
+# and stored with one set_many. "vary" is a function of an item returning
+# a tuple of extra key values
+def render_item_fragments(template_name, items, vary=None, csrf_token=None):
+    items = list(items)
+    keys = [fragment_key(template_name, item, vary(item) if vary else ())
+            for item in items]
+    fragments = cache.get_many(keys)
+    missing = {}
+    template = None
+    for key, item in zip(keys, items):
+        if key in fragments or key in missing:
+            continue
+        if template is None:
+            template = get_template(template_name)
+        missing[key] = template.render({'item': item,
+                                        'csrf_token': CSRF_PLACEHOLDER})
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+        fragments.update(missing)
+    csrf_token = str(csrf_token) if csrf_token else ''
+    return [mark_safe(fragments[key].replace(CSRF_PLACEHOLDER, csrf_token))
+            for key in keys]
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+from courses.models import Module
+
+
+# load benchmark of the course views through the WSGI and the ASGI handler
+# requests are sent in-process by the test clients, with rising numbers of
+# concurrent clients (threads for WSGI, tasks on one event loop for ASGI)
+class Command(BaseCommand):
+    help = 'Compare requests/sec and p99 latency of WSGI and ASGI views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='owner of the courses used in requests')
+        parser.add_argument('--concurrency', default='1,4,16,64',
+                            help='comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per concurrency level')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User {} does not exist'.format(options['username']))
+        module = Module.objects.filter(course__owner=user).first()
+        if module is None:
+            raise CommandError('User {} has no modules'.format(user))
+
+        client = Client()
+        client.force_login(user)
+        self.cookies = client.cookies
+        targets = [
+            ('course list', reverse('manage_course_list'),
+             reverse('manage_course_list_async')),
+            ('content list', reverse('module_content_list', args=[module.id]),
+             reverse('module_content_list_async', args=[module.id])),
+        ]
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        total = options['requests']
+
+        self.stdout.write('{:<14} {:>5} {:>6} {:>10} {:>10}'.format(
+            'view', 'conc', 'server', 'req/s', 'p99 (ms)'))
+        # requests of the test clients come from "testserver"
+        with override_settings(ALLOWED_HOSTS=['testserver'], REQUEST_METRICS_SAMPLE_RATE=0):
+            for name, sync_url, async_url in targets:
+                for level in levels:
+                    self.run_level(name, sync_url, async_url, level, total)
+
+    def run_level(self, name, sync_url, async_url, level, total):
+        for server, latencies, elapsed in (
+                ('wsgi',) + self.run_wsgi(sync_url, level, total),
+                ('asgi',) + asyncio.run(self.run_asgi(async_url, level, total))):
+            self.stdout.write('{:<14} {:>5} {:>6} {:>10.1f} {:>10.2f}'.format(
+                name, level, server, len(latencies) / elapsed,
+                self.percentile(latencies, 99) * 1000))
+
+    # failed requests would make the numbers meaningless
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise CommandError('{} {}'.format(response.status_code,
+                                              response.request['PATH_INFO']))
+
+    def percentile(self, values, percent):
+        values = sorted(values)
+        index = min(len(values) - 1, int(round(len(values) * percent / 100.0)))
+        return values[index]
+
+    def run_wsgi(self, url, concurrency, total):
+        def worker(count):
+            client = Client()
+            client.cookies = self.cookies
+            latencies = []
+            try:
+                for i in range(count):
+                    start = time.perf_counter()
+                    self.check_response(client.get(url))
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+            return latencies
+
+        counts = self.split(total, concurrency)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(worker, counts))
+        elapsed = time.perf_counter() - start
+        return [latency for result in results for latency in result], elapsed
+
+    async def run_asgi(self, url, concurrency, total):
+        async def worker(count):
+            client = AsyncClient()
+            client.cookies = self.cookies
+            latencies = []
+            for i in range(count):
+                start = time.perf_counter()
+                self.check_response(await client.get(url))
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        counts = self.split(total, concurrency)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[worker(count) for count in counts])
+        elapsed = time.perf_counter() - start
+        return [latency for result in results for latency in result], elapsed
+
+    def split(self, total, parts):
+        return [total // parts + (1 if i < total % parts else 0)
+                for i in range(parts)]
@@ -0,0 +1,44 @@
+import timeit
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.forms.models import modelform_factory
+from courses.registry import registry, EXCLUDED_FIELDS
+
+
+# compare per-request cost of resolving the content model and its form class
+# in ContentCreateUpdateView: apps.get_model() + modelform_factory() on every
+# request (before) against a lookup in the content registry (after)
+class Command(BaseCommand):
+    help = 'Micro-benchmark of content form resolution per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000,
+                            help='calls per measurement')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='measurements, the best one is reported')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        repeat = options['repeat']
+
+        def factory(model_name):
+            model = apps.get_model(app_label='courses', model_name=model_name)
+            Form = modelform_factory(model, exclude=EXCLUDED_FIELDS)
+            return Form()
+
+        def registered(model_name):
+            Form = registry.get_form_class(registry.get_model(model_name)._meta.model_name)
+            return Form()
+
+        self.stdout.write('{:<8} {:>14} {:>14} {:>9}'.format(
+            'model', 'factory (us)', 'registry (us)', 'speedup'))
+        for model_name in registry.model_names():
+            before = self.measure(factory, model_name, number, repeat)
+            after = self.measure(registered, model_name, number, repeat)
+            self.stdout.write('{:<8} {:>14.1f} {:>14.1f} {:>8.1f}x'.format(
+                model_name, before, after, before / after))
+
+    # best time of one call in microseconds
+    def measure(self, func, model_name, number, repeat):
+        timer = timeit.Timer(lambda: func(model_name))
+        return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
@@ -0,0 +1,158 @@
+import json
+import random
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from courses.models import Module
+
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round((len(values) - 1) * percent / 100.0)))
+    return values[index]
+
+
+# reader throughput of the management pages alone and while other threads
+# reorder modules (ModuleOrderView), run in process with one database
+# connection per thread on data from generate_data. With the rollback
+# journal (--journal-mode delete) every reorder commit blocks the readers,
+# with WAL they keep reading
+class Command(BaseCommand):
+    help = 'Measure reads per second with and without concurrent reorders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='seconds of every phase')
+        parser.add_argument('--prefix', default='instructor',
+                            help='usernames of generate_data users')
+        parser.add_argument('--journal-mode', choices=['wal', 'delete'],
+                            help='SQLite journal mode (default from SQLITE_PRAGMAS)')
+        parser.add_argument('--output', help='write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__startswith=options['prefix'],
+                                         courses_created__modules__isnull=False)
+                                 .distinct()
+                                 .order_by('id')[:options['readers'] + options['writers']])
+        if not users:
+            raise CommandError('No users with modules, run generate_data first')
+        self.modules = {}
+        for course_id, module_id in Module.objects.filter(course__owner__in=users) \
+                                                  .values_list('course_id', 'id'):
+            self.modules.setdefault(course_id, []).append(module_id)
+        self.courses = {user.id: list(user.courses_created.filter(id__in=self.modules)
+                                                          .values_list('id', flat=True))
+                        for user in users}
+
+        pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+        if options['journal_mode']:
+            pragmas['journal_mode'] = options['journal_mode']
+        # new pragmas are applied by the next connections, the journal mode
+        # is switched by the first one while no other connection is open
+        connections.close_all()
+        with override_settings(SQLITE_PRAGMAS=pragmas, REQUEST_METRICS_SAMPLE_RATE=0):
+            connection.ensure_connection()
+            results = {'journal_mode': pragmas.get('journal_mode'),
+                       'readers': options['readers'],
+                       'writers': options['writers'],
+                       'reads_only': self.run(users, options, writers=0),
+                       'reads_with_writes': self.run(users, options,
+                                                     writers=options['writers'])}
+        for phase in ('reads_only', 'reads_with_writes'):
+            self.stdout.write(self.format(phase, results[phase]))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def client(self, user):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        return client
+
+    # manage course list and module content lists of the user
+    def read(self, client, user):
+        course_ids = self.courses[user.id]
+        if random.random() < 0.5 or not course_ids:
+            return client.get(reverse('manage_course_list')).status_code
+        module_id = random.choice(self.modules[random.choice(course_ids)])
+        return client.get(reverse('module_content_list', args=[module_id])).status_code
+
+    # move a random module of a course of the user to another position
+    def write(self, client, user):
+        modules = self.modules[random.choice(self.courses[user.id])]
+        return client.post(reverse('module_order'),
+                           {'id': random.choice(modules),
+                            'new_index': random.randrange(len(modules))},
+                           content_type='application/json').status_code
+
+    def worker(self, action, user, deadline, result):
+        try:
+            client = self.client(user)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    status = action(client, user)
+                except Exception:
+                    status = None
+                latency = time.perf_counter() - start
+                with self.lock:
+                    result['latencies'].append(latency)
+                    if status is None or status >= 400:
+                        result['errors'] += 1
+        finally:
+            connections.close_all()
+
+    def run(self, users, options, writers):
+        self.lock = threading.Lock()
+        reads = {'latencies': [], 'errors': 0}
+        writes = {'latencies': [], 'errors': 0}
+        deadline = time.perf_counter() + options['duration']
+        threads = [threading.Thread(target=self.worker,
+                                    args=(self.read, users[number % len(users)],
+                                          deadline, reads))
+                   for number in range(options['readers'])]
+        threads += [threading.Thread(target=self.worker,
+                                     args=(self.write, users[-1 - number % len(users)],
+                                           deadline, writes))
+                    for number in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {'reads': self.summary(reads, elapsed),
+                'writes': self.summary(writes, elapsed) if writers else None}
+
+    def summary(self, result, elapsed):
+        latencies = result['latencies']
+        stats = {'requests': len(latencies),
+                 'errors': result['errors'],
+                 'throughput': round(len(latencies) / elapsed, 2)}
+        if latencies:
+            stats.update({'p{}_ms'.format(p): round(percentile(latencies, p) * 1000, 2)
+                          for p in PERCENTILES})
+        return stats
+
+    def format(self, phase, result):
+        lines = []
+        for kind in ('reads', 'writes'):
+            stats = result[kind]
+            if not stats:
+                continue
+            lines.append('{:<18} {:<6} {:>8.1f} req/s {:>5} errors  '.format(
+                phase, kind, stats['throughput'], stats['errors']) +
+                '  '.join('p{} {:.1f} ms'.format(p, stats.get('p{}_ms'.format(p), 0))
+                          for p in PERCENTILES))
+        return '\n'.join(lines)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Task
+from courses.tasks import enqueue, run_pool, run_worker, task
+
+
+def hash_rounds(rounds):
+    data = b'x' * 1024
+    for number in range(rounds):
+        data = hashlib.sha256(data).digest() * 32
+    return data
+
+
+# task of the benchmark: "cpu" hashes "cost" rounds, "io" sleeps "cost"
+# milliseconds (like a task waiting for files or a service). It's registered
+# by this module, so process pools need the "fork" start method
+@task('benchmark')
+def benchmark_task(kind='noop', cost=0):
+    if kind == 'io':
+        time.sleep(cost / 1000.0)
+    elif kind == 'cpu':
+        hash_rounds(cost)
+
+
+# throughput of the task queue on the configured database: enqueue (one
+# transaction per task like a request, and in bulk), dequeue of empty
+# tasks by one worker, and tasks per second of thread and process pools
+# of 1, 2, 4 ... workers on CPU and I/O bound tasks. Workers claim only
+# benchmark tasks, other queued tasks are left alone
+class Command(BaseCommand):
+    help = 'Measure task queue and worker pool throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000,
+                            help='tasks of the enqueue and dequeue phases')
+        parser.add_argument('--scaling-tasks', type=int, default=200,
+                            help='tasks of every pool run')
+        parser.add_argument('--cost', type=float, default=20,
+                            help='milliseconds of work of a pool task')
+        parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--output', help='write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        self.clear()
+        results = {'cpu_count': os.cpu_count()}
+        try:
+            results['enqueue'] = self.measure_enqueue(options['tasks'])
+            results['dequeue'] = self.measure_dequeue(options)
+            results['scaling'] = self.measure_scaling(options)
+        finally:
+            self.clear()
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def clear(self):
+        Task.objects.filter(name='benchmark').delete()
+
+    def rate(self, count, elapsed):
+        return round(count / elapsed, 1) if elapsed else None
+
+    def measure_enqueue(self, count):
+        start = time.perf_counter()
+        for number in range(count):
+            with transaction.atomic():
+                enqueue('benchmark')
+        single = self.rate(count, time.perf_counter() - start)
+        start = time.perf_counter()
+        with transaction.atomic():
+            for number in range(count):
+                enqueue('benchmark')
+        bulk = self.rate(count, time.perf_counter() - start)
+        self.stdout.write('enqueue  {:>10.1f} tasks/s (transaction per task) '
+                          '{:>10.1f} tasks/s (one transaction)'.format(single, bulk))
+        return {'per_transaction': single, 'one_transaction': bulk}
+
+    # claim, run and delete the tasks of the enqueue phase
+    def measure_dequeue(self, options):
+        count = Task.objects.filter(name='benchmark').count()
+        start = time.perf_counter()
+        done = run_worker(batch_size=options['batch_size'], once=True,
+                          names=['benchmark'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write('dequeue  {:>10.1f} tasks/s ({} tasks, batch of {})'.format(
+            self.rate(done, elapsed), count, options['batch_size']))
+        return {'tasks': done, 'throughput': self.rate(done, elapsed)}
+
+    def measure_scaling(self, options):
+        counts = []
+        workers = 1
+        while workers < options['max_workers']:
+            counts.append(workers)
+            workers *= 2
+        counts.append(options['max_workers'])
+        # hash rounds of about "cost" milliseconds on one core
+        start = time.perf_counter()
+        hash_rounds(10000)
+        rounds = int(10000 * options['cost'] / 1000.0 / (time.perf_counter() - start))
+        costs = {'cpu': max(rounds, 1), 'io': options['cost']}
+        pools = ['thread', 'process']
+        if multiprocessing.get_start_method() != 'fork':
+            self.stderr.write('Process pools skipped, the benchmark task needs fork')
+            pools.remove('process')
+        results = []
+        for kind in ('cpu', 'io'):
+            for pool in pools:
+                for workers in counts:
+                    with transaction.atomic():
+                        for number in range(options['scaling_tasks']):
+                            enqueue('benchmark', {'kind': kind, 'cost': costs[kind]})
+                    start = time.perf_counter()
+                    done = run_pool(workers, pool, batch_size=options['batch_size'],
+                                    once=True, names=['benchmark'])
+                    throughput = self.rate(done, time.perf_counter() - start)
+                    self.stdout.write('{:<4} {:<8} {:>3} workers {:>8.1f} tasks/s'.format(
+                        kind, pool, workers, throughput))
+                    results.append({'kind': kind, 'pool': pool, 'workers': workers,
+                                    'tasks': done, 'throughput': throughput})
+        return results
@@ -0,0 +1,40 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from courses.transfer import TransferError, clone_course
+
+
+# copy a course for a new term, optionally for another owner
+class Command(BaseCommand):
+    help = 'Duplicate a course with its modules, contents and items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='id or slug of the course')
+        parser.add_argument('--owner', help='username of the new owner, '
+                                            'the course owner by default')
+        parser.add_argument('--slug')
+        parser.add_argument('--title')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.select_related('subject', 'owner')
+        lookup = options['course']
+        course = courses.filter(id=lookup).first() if lookup.isdigit() else None
+        if course is None:
+            course = courses.filter(slug=lookup).first()
+        if course is None:
+            raise CommandError('Course {} does not exist'.format(lookup))
+        owner = course.owner
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError('User {} does not exist'.format(options['owner']))
+
+        start = time.perf_counter()
+        try:
+            clone = clone_course(course, owner, slug=options['slug'],
+                                 title=options['title'])
+        except TransferError as e:
+            raise CommandError(e)
+        self.stdout.write('Created {} ({}) in {:.1f} ms'.format(
+            clone.slug, clone.id, (time.perf_counter() - start) * 1000))
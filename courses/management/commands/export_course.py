@@ -0,0 +1,31 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from courses.transfer import export_course
+
+
+# write a course archive (see courses.transfer) to a file or stdout
+class Command(BaseCommand):
+    help = 'Export a course with its modules, contents and files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='id or slug of the course')
+        parser.add_argument('-o', '--output',
+                            help='archive file, stdout when not given')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.select_related('subject')
+        lookup = options['course']
+        course = courses.filter(id=lookup).first() if lookup.isdigit() else None
+        if course is None:
+            course = courses.filter(slug=lookup).first()
+        if course is None:
+            raise CommandError('Course {} does not exist'.format(lookup))
+
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                export_course(course, f)
+            self.stderr.write('Exported {} to {}'.format(course.slug,
+                                                         options['output']))
+        else:
+            export_course(course, sys.stdout.buffer)
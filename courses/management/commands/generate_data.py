@@ -0,0 +1,185 @@
+import random
+import time
+from io import BytesIO
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses import search
+from courses.catalog import touch_catalog
+from courses.models import Subject, Course, Module, Content, Text, Video, File, Image
+from courses.storage import blob_storage
+from courses.transfer import bulk_create_with_ids
+
+
+# share of every content type in generated modules
+CONTENT_MIX = [(Text, 50), (Video, 25), (File, 15), (Image, 10)]
+# distinct files and images, shared by the generated items like real blobs
+BLOB_POOL = 8
+WORDS = ('course module lesson example exercise theory practice python django '
+         'music physics algebra history design data model query index cache '
+         'server client request response template form view test').split()
+
+
+# production sized data for local profiling: instructors with courses,
+# modules and mixed contents, inserted with bulk queries per instructor.
+# Module and content orders are reserved per scope with OrderField, so
+# objects created later continue after the generated ones
+class Command(BaseCommand):
+    help = 'Generate users, courses, modules and contents in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=20,
+                            help='courses per user')
+        parser.add_argument('--modules', type=int, default=8,
+                            help='modules per course')
+        parser.add_argument('--contents', type=int, default=20,
+                            help='contents per module')
+        parser.add_argument('--subjects', type=int, default=0,
+                            help='subjects generated besides the fixtures')
+        parser.add_argument('--prefix', default='instructor',
+                            help='prefix of generated usernames')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-index', action='store_true',
+                            help='skip the search index (rebuild_search_index)')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        subjects = self.create_subjects(options['subjects'])
+        users = self.create_users(options['users'], options['prefix'],
+                                  options['password'])
+        self.blobs = self.create_blobs()
+        self.content_types = {model: ContentType.objects.get_for_model(model)
+                              for model, weight in CONTENT_MIX}
+        totals = {'courses': 0, 'modules': 0, 'contents': 0}
+        for user in users:
+            with transaction.atomic():
+                counts = self.create_courses(user, subjects, options)
+            for key in totals:
+                totals[key] += counts[key]
+            self.stdout.write('{}: {courses} courses, {modules} modules, '
+                              '{contents} contents'.format(user.username, **counts))
+        touch_catalog()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {} users, {courses} courses, {modules} modules and '
+            '{contents} contents in {:.1f} s'.format(
+                len(users), time.perf_counter() - start, **totals)))
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for number in range(count))
+
+    def create_subjects(self, count):
+        if not Subject.objects.exists():
+            call_command('loaddata', 'subjects', verbosity=0)
+        existing = Subject.objects.count()
+        if count:
+            bulk_create_with_ids(Subject, [
+                Subject(title='Subject {}'.format(number),
+                        slug='subject-{}'.format(number))
+                for number in range(existing, existing + count)])
+        return list(Subject.objects.all())
+
+    def create_users(self, count, prefix, password):
+        first = User.objects.filter(username__startswith=prefix).count()
+        # hashing is slow on purpose, one hash is shared by all users
+        hashed = make_password(password)
+        users = bulk_create_with_ids(User, [
+            User(username='{}{}'.format(prefix, number), password=hashed,
+                 first_name=prefix.title(), last_name=str(number))
+            for number in range(first, first + count)], self.batch_size)
+        permissions = Permission.objects.filter(
+            content_type__app_label='courses',
+            codename__in=['add_course', 'change_course', 'delete_course',
+                          'add_module', 'change_module', 'delete_module'])
+        Through = User.user_permissions.through
+        Through.objects.bulk_create([Through(user_id=user.id, permission_id=permission.id)
+                                     for user in users for permission in permissions],
+                                    batch_size=self.batch_size)
+        return users
+
+    # blob names of generated files and images, saved once
+    def create_blobs(self):
+        blobs = {File: [], Image: []}
+        for number in range(BLOB_POOL):
+            data = '{}\n'.format(self.words(200)).encode()
+            blobs[File].append(blob_storage.save('document.txt', ContentFile(data)))
+        try:
+            from PIL import Image as PILImage
+        except ImportError:
+            return blobs
+        for number in range(BLOB_POOL):
+            color = tuple(self.random.randrange(256) for channel in range(3))
+            buffer = BytesIO()
+            PILImage.new('RGB', (640, 480), color).save(buffer, 'PNG')
+            blobs[Image].append(blob_storage.save('picture.png',
+                                                  ContentFile(buffer.getvalue())))
+        return blobs
+
+    def create_item(self, model, owner, number):
+        item = model(owner=owner, title='{} {}'.format(self.words(3).title(), number))
+        if model is Text:
+            item.content = self.words(self.random.randint(50, 400))
+        elif model is Video:
+            item.url = 'https://www.youtube.com/watch?v=video{}'.format(number)
+        elif model is File:
+            item.file = self.random.choice(self.blobs[File])
+        else:
+            item.image = self.random.choice(self.blobs[Image])
+        return item
+
+    def create_courses(self, user, subjects, options):
+        courses = bulk_create_with_ids(Course, [
+            Course(owner=user, subject=self.random.choice(subjects),
+                   title='{} {}'.format(self.words(3).title(), number),
+                   slug='{}-course-{}'.format(user.username, number),
+                   overview=self.words(60))
+            for number in range(options['courses'])], self.batch_size)
+
+        # orders are reserved with one counter update per course
+        modules = [Module(course=course, title=self.words(4).title(),
+                          description=self.words(30))
+                   for course in courses for number in range(options['modules'])]
+        Module._meta.get_field('order').allocate_bulk(modules)
+        bulk_create_with_ids(Module, modules, self.batch_size)
+
+        mix = [model for model, weight in CONTENT_MIX
+               if model is not Image or self.blobs[Image]]
+        weights = [weight for model, weight in CONTENT_MIX if model in mix]
+        placements = [(module, self.random.choices(mix, weights)[0])
+                      for module in modules for number in range(options['contents'])]
+        items = {model: [] for model in mix}
+        for number, (module, model) in enumerate(placements):
+            items[model].append(self.create_item(model, user, number))
+        for model, objs in items.items():
+            bulk_create_with_ids(model, objs, self.batch_size)
+
+        # generic relation: content type and id of the item
+        created = {model: iter(objs) for model, objs in items.items()}
+        contents = []
+        for module, model in placements:
+            item = next(created[model])
+            contents.append(Content(module=module,
+                                    content_type=self.content_types[model],
+                                    object_id=item.id))
+        Content._meta.get_field('order').allocate_bulk(contents)
+        Content.objects.bulk_create(contents, batch_size=self.batch_size)
+
+        if not options['no_index']:
+            search.reindex('course', [course.id for course in courses], self.batch_size)
+            search.reindex('module', [module.id for module in modules], self.batch_size)
+            text_ids = [item.id for item in items.get(Text, [])]
+            for start in range(0, len(text_ids), self.batch_size):
+                search.reindex('text', text_ids[start:start + self.batch_size],
+                               self.batch_size)
+        return {'courses': len(courses), 'modules': len(modules),
+                'contents': len(contents)}
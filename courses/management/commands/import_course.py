@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Subject
+from courses.transfer import TransferError, import_course
+
+
+# create a course from an archive made by export_course
+class Command(BaseCommand):
+    help = 'Import a course archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive')
+        parser.add_argument('--owner', required=True,
+                            help='username of the new owner')
+        parser.add_argument('--subject',
+                            help='slug of the subject, the archived one by default')
+        parser.add_argument('--slug',
+                            help='slug of the course, the archived one by default')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError('User {} does not exist'.format(options['owner']))
+        subject = None
+        if options['subject']:
+            subject = Subject.objects.filter(slug=options['subject']).first()
+            if subject is None:
+                raise CommandError('Subject {} does not exist'.format(options['subject']))
+
+        try:
+            with open(options['archive'], 'rb') as f:
+                course = import_course(f, owner, subject=subject,
+                                       slug=options['slug'])
+        except (OSError, TransferError) as e:
+            raise CommandError(e)
+        self.stdout.write('Imported course {} ({})'.format(course.slug, course.id))
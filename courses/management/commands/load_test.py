@@ -0,0 +1,228 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from courses.models import Module, Content
+
+
+DEFAULT_MIX = 'browse=40,catalog=20,module=25,reorder=10,upload=5'
+PERCENTILES = [50, 90, 95, 99]
+
+
+# one simulated instructor: a logged in HTTP session with the ids of
+# own modules and contents, requests are sent with urllib
+class Session(object):
+    def __init__(self, base_url, username, password, modules, timeout):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.timeout = timeout
+        self.modules = modules
+        self.login(username, password)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, method, path, data=None, headers=None):
+        url = urljoin(self.base_url, path)
+        headers = dict(headers or {})
+        headers.setdefault('X-CSRFToken', self.csrf_token())
+        headers.setdefault('Referer', url)
+        request = Request(url, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+    def json(self, method, path, data, headers=None):
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return self.request(method, path, json.dumps(data).encode(), headers)
+
+    def login(self, username, password):
+        path = reverse('login')
+        self.request('GET', path)
+        status, body = self.request('POST', path, urlencode({
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self.csrf_token(),
+            'next': reverse('manage_course_list'),
+        }).encode(), {'Content-Type': 'application/x-www-form-urlencoded'})
+        if not any(cookie.name == 'sessionid' for cookie in self.cookies):
+            raise CommandError('Login of {} failed ({})'.format(username, status))
+
+    # traffic mix actions, every action returns the last HTTP status
+
+    def browse(self):
+        return self.request('GET', reverse('manage_course_list'))[0]
+
+    def catalog(self):
+        return self.request('GET', reverse('course_list'))[0]
+
+    def module(self):
+        module_id = random.choice(list(self.modules))
+        return self.request('GET', reverse('module_content_list', args=[module_id]))[0]
+
+    # drag a content to another position in its module
+    def reorder(self):
+        module_id = random.choice([id for id, contents in self.modules.items() if contents])
+        contents = self.modules[module_id]
+        return self.json('POST', reverse('content_order'), {
+            'id': random.choice(contents),
+            'new_index': random.randrange(len(contents)),
+        })[0]
+
+    # small file sent as a chunked upload (start and one chunk)
+    def upload(self):
+        module_id = random.choice(list(self.modules))
+        data = 'load test {} {}\n'.format(time.time(), random.random()).encode() * 64
+        status, body = self.json('POST', reverse('module_content_upload',
+                                                 args=[module_id, 'file']),
+                                 {'title': 'Load test upload', 'filename': 'load.txt',
+                                  'size': len(data)})
+        if status != 201:
+            return status
+        upload_id = json.loads(body.decode())['id']
+        return self.request('PUT', reverse('chunked_upload', args=[upload_id]), data, {
+            'Content-Type': 'application/octet-stream',
+            'X-Upload-Offset': '0',
+            'X-Chunk-Checksum': hashlib.sha256(data).hexdigest(),
+        })[0]
+
+
+# replay a mix of instructor traffic against a running server (e.g.
+# runserver or gunicorn on data from generate_data) and report throughput
+# and latency percentiles per action
+class Command(BaseCommand):
+    help = 'Send a realistic mix of requests to a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--prefix', default='instructor',
+                            help='usernames of generate_data users')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30,
+                            help='seconds of traffic')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='action=weight pairs: browse (course list), '
+                                 'catalog, module (content list), reorder, upload')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        users = list(User.objects.filter(username__startswith=options['prefix'],
+                                         courses_created__isnull=False)
+                                 .distinct()
+                                 .order_by('id')[:options['concurrency']])
+        if not users:
+            raise CommandError('No users with courses, run generate_data first')
+
+        sessions = []
+        for number in range(options['concurrency']):
+            user = users[number % len(users)]
+            try:
+                sessions.append(Session(options['url'], user.username,
+                                        options['password'],
+                                        self.get_modules(user), options['timeout']))
+            except URLError as e:
+                raise CommandError('Server not reachable: {}'.format(e.reason))
+
+        self.results = {name: {'latencies': [], 'errors': 0} for name in mix}
+        self.lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self.run, args=(session, mix, deadline))
+                   for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.report(time.perf_counter() - start, options)
+
+    def parse_mix(self, value):
+        try:
+            mix = {name: float(weight) for name, weight in
+                   (pair.split('=') for pair in value.split(','))}
+        except ValueError:
+            raise CommandError('Invalid mix {}'.format(value))
+        unknown = set(mix) - {'browse', 'catalog', 'module', 'reorder', 'upload'}
+        if unknown:
+            raise CommandError('Unknown actions {}'.format(', '.join(sorted(unknown))))
+        return mix
+
+    # module id -> content ids, of the first modules of the user
+    def get_modules(self, user, limit=50):
+        module_ids = list(Module.objects.filter(course__owner=user)
+                                        .values_list('id', flat=True)[:limit])
+        modules = {id: [] for id in module_ids}
+        for module_id, content_id in Content.objects.filter(module_id__in=module_ids) \
+                                                    .values_list('module_id', 'id'):
+            modules[module_id].append(content_id)
+        return modules
+
+    def run(self, session, mix, deadline):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = getattr(session, name)()
+            except (URLError, OSError):
+                status = None
+            latency = time.perf_counter() - start
+            with self.lock:
+                result = self.results[name]
+                result['latencies'].append(latency)
+                if status is None or status >= 400:
+                    result['errors'] += 1
+
+    def percentile(self, values, percent):
+        values = sorted(values)
+        index = min(len(values) - 1, int(round((len(values) - 1) * percent / 100.0)))
+        return values[index]
+
+    def report(self, elapsed, options):
+        summary = {'concurrency': options['concurrency'],
+                   'duration': round(elapsed, 3),
+                   'actions': {}}
+        total = 0
+        self.stdout.write('{:<10} {:>8} {:>7} {:>9}'.format('action', 'requests',
+                                                            'errors', 'req/s') +
+                          ''.join('{:>9}'.format('p{}'.format(p)) for p in PERCENTILES) +
+                          '{:>9}'.format('max'))
+        for name, result in self.results.items():
+            latencies = result['latencies']
+            if not latencies:
+                continue
+            total += len(latencies)
+            stats = {'requests': len(latencies),
+                     'errors': result['errors'],
+                     'throughput': round(len(latencies) / elapsed, 2),
+                     'max_ms': round(max(latencies) * 1000, 2)}
+            stats.update({'p{}_ms'.format(p): round(self.percentile(latencies, p) * 1000, 2)
+                          for p in PERCENTILES})
+            summary['actions'][name] = stats
+            self.stdout.write('{:<10} {:>8} {:>7} {:>9.1f}'.format(
+                name, stats['requests'], stats['errors'], stats['throughput']) +
+                ''.join('{:>9.1f}'.format(stats['p{}_ms'.format(p)]) for p in PERCENTILES) +
+                '{:>9.1f}'.format(stats['max_ms']))
+        summary['throughput'] = round(total / elapsed, 2)
+        self.stdout.write('Total: {} requests in {:.1f} s, {:.1f} req/s (latencies in ms)'.format(
+            total, elapsed, summary['throughput']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(summary, f, indent=2)
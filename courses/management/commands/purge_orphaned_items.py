@@ -0,0 +1,45 @@
+from datetime import timedelta
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from courses.deletion import delete_items
+from courses.models import Content
+from courses.registry import registry
+
+
+# items (text/video/image/file) which are not bound to any content,
+# left by course/module deletes before items were deleted with them
+class Command(BaseCommand):
+    help = 'Delete content items which are not used by any module'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='skip items created in the last seconds '
+                                 '(their content may not be saved yet)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        created_before = timezone.now() - timedelta(seconds=options['min_age'])
+        for model in registry.models():
+            content_type = ContentType.objects.get_for_model(model)
+            bound = Content.objects.filter(content_type=content_type) \
+                                   .values('object_id')
+            orphans = model.objects.filter(created__lt=created_before) \
+                                   .exclude(id__in=bound) \
+                                   .order_by('id') \
+                                   .values_list('id', flat=True)
+            total = 0
+            last_id = 0
+            while True:
+                ids = list(orphans.filter(id__gt=last_id)[:options['batch_size']])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                total += len(ids)
+                if not options['dry_run']:
+                    delete_items(model, ids)
+            self.stdout.write('{}: {} orphaned {}'.format(
+                model._meta.verbose_name_plural,
+                total,
+                'found' if options['dry_run'] else 'deleted'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses import search
+from courses.models import Course, Module, Text
+
+
+# index all courses, modules and texts again, in batches of objects; every
+# kind is replaced in one transaction, searches see the old documents until
+# it commits and a failed rebuild keeps them
+class Command(BaseCommand):
+    help = 'Rebuild the course search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for kind, model in (('course', Course), ('module', Module), ('text', Text)):
+            total = 0
+            last_id = 0
+            with transaction.atomic():
+                search.clear(kind)
+                while True:
+                    ids = list(model.objects.filter(id__gt=last_id)
+                                            .order_by('id')
+                                            .values_list('id', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    last_id = ids[-1]
+                    total += search.reindex(kind, ids, batch_size=batch_size)
+            self.stdout.write('Indexed {} {} documents'.format(total, kind))
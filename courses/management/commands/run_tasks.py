@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+import signal
+from django.core.management.base import BaseCommand
+from courses import tasks
+
+
+# worker pool running queued tasks (courses.tasks) until it is stopped with
+# Ctrl+C or SIGTERM; running tasks are finished first. Threads suit tasks
+# waiting on the database and files, processes CPU bound ones (images)
+class Command(BaseCommand):
+    help = 'Run queued background tasks in a pool of workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--batch-size', type=int, default=tasks.BATCH_SIZE,
+                            help='tasks claimed at once by a worker')
+        parser.add_argument('--lease', type=int, default=tasks.LEASE,
+                            help='seconds before tasks of a dead worker run again')
+        parser.add_argument('--poll-interval', type=float, default=tasks.POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true',
+                            help='stop when no task is due')
+
+    def handle(self, *args, **options):
+        # shared by threads and processes
+        stop = multiprocessing.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping after running tasks')
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        done = tasks.run_pool(options['workers'], options['pool'], stop,
+                              batch_size=options['batch_size'],
+                              lease=options['lease'],
+                              poll_interval=options['poll_interval'],
+                              once=options['once'])
+        self.stdout.write('Ran {} tasks'.format(done))
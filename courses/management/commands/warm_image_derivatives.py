@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.derivatives import VARIANTS, submit
+from courses.models import Image, ImageDerivative
+
+
+# generate missing or outdated derivatives of existing images,
+# images are read in batches and rendered in the derivative thread pool
+class Command(BaseCommand):
+    help = 'Pre-generate resized versions of course images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', action='append', dest='variants',
+                            help='variant to generate (default: all)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        variants = options['variants'] or list(VARIANTS)
+        for variant in variants:
+            if variant not in VARIANTS:
+                raise CommandError('Unknown variant {}'.format(variant))
+        batch_size = options['batch_size']
+
+        generated = failed = 0
+        last_id = 0
+        while True:
+            images = list(Image.objects.filter(id__gt=last_id)
+                                       .order_by('id')
+                                       .values_list('id', 'updated')[:batch_size])
+            if not images:
+                break
+            last_id = images[-1][0]
+            # derivatives of the whole batch with one query
+            fresh = set(ImageDerivative.objects.filter(image_id__in=[id for id, updated in images],
+                                                       variant__in=variants)
+                                               .values_list('image_id', 'variant', 'source_updated'))
+            futures = [submit(id, variant)
+                       for id, updated in images
+                       for variant in variants
+                       if (id, variant, updated) not in fresh]
+            for future in futures:
+                try:
+                    future.result()
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(str(e))
+        self.stdout.write('Generated {} derivatives, {} failed'.format(generated, failed))
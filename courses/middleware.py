@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+logger = logging.getLogger('courses.metrics')
+# recorder of the measured request; context variables follow the request
+# into the threads of sync_to_async, so queries of async views are counted
+_recorder = ContextVar('courses_metrics_recorder', default=None)
+
+
+# middleware for both handlers: with an async get_response (ASGI) the
+# instance is marked as a coroutine function and requests go to acall,
+# without it Django would run the middleware and everything after it
+# through sync_to_async, in the one thread sensitive thread on Django 3.1
+class SyncAsyncMiddleware(object):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        return self.call(request)
+
+    def call(self, request):
+        raise NotImplementedError
+
+    async def acall(self, request):
+        raise NotImplementedError
+
+# literals and lists of placeholders are removed from SQL, so queries which
+# differ only by values (e.g. one per row of a list) get the same signature
+SIGNATURE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\?(?:\s*,\s*\?)*\)'), '(?...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def sql_signature(sql):
+    for pattern, replacement in SIGNATURE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+# execute wrapper counting queries and their time, installed on every
+# database connection for the measured request only
+class QueryRecorder(object):
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = {}
+        # queries run while the template is rendered (lazy querysets)
+        self.rendering = False
+        self.render_count = 0
+        # async views may query from several threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            signature = sql_signature(sql)
+            with self.lock:
+                self.duration += duration
+                self.count += 1
+                if self.rendering:
+                    self.render_count += 1
+                self.signatures[signature] = self.signatures.get(signature, 0) + 1
+
+    # signatures run at least "threshold" times, most repeated first
+    def duplicates(self, threshold):
+        return sorted(((count, signature)
+                       for signature, count in self.signatures.items()
+                       if count >= threshold), reverse=True)
+
+
+# execute wrapper of every connection, passes queries to the recorder of
+# the measured request (if any)
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# connections of threads used later by sync_to_async, connected by an
+# enabled middleware only so queries don't pay for the wrapper otherwise
+def connection_recorded(sender, connection, **kwargs):
+    install_recorder(connection)
+
+
+# per request number of SQL queries, database time, repeated queries
+# (N+1 patterns) and template render time, sent as a Server-Timing header
+# and one JSON log line on the "courses.metrics" logger. Only a sample of
+# requests is measured (REQUEST_METRICS_SAMPLE_RATE), other requests pass
+# through untouched; with a rate of 0 the middleware is not loaded at all
+class RequestMetricsMiddleware(SyncAsyncMiddleware):
+    def __init__(self, get_response):
+        super(RequestMetricsMiddleware, self).__init__(get_response)
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0)
+        self.duplicate_threshold = getattr(settings,
+                                           'REQUEST_METRICS_DUPLICATE_THRESHOLD', 3)
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        connection_created.connect(connection_recorded,
+                                   dispatch_uid='courses.metrics')
+
+    def is_sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self, request):
+        # connections opened before the middleware was loaded
+        for connection in connections.all():
+            install_recorder(connection)
+        request._metrics = QueryRecorder()
+        return _recorder.set(request._metrics), time.perf_counter()
+
+    def finish(self, request, response, token, start):
+        _recorder.reset(token)
+        self.report(request, response, request._metrics, time.perf_counter() - start)
+        return response
+
+    def call(self, request):
+        if not self.is_sampled():
+            return self.get_response(request)
+        token, start = self.start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _recorder.reset(token)
+            raise
+        return self.finish(request, response, token, start)
+
+    async def acall(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+        token, start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _recorder.reset(token)
+            raise
+        return self.finish(request, response, token, start)
+
+    # template responses are rendered after the view, the render time is
+    # measured from here to the post render callback
+    def process_template_response(self, request, response):
+        recorder = getattr(request, '_metrics', None)
+        if recorder is None:
+            return response
+        start = time.perf_counter()
+        recorder.rendering = True
+
+        def rendered(response):
+            recorder.rendering = False
+            recorder.render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, recorder, total):
+        render_time = getattr(recorder, 'render_time', None)
+        duplicates = recorder.duplicates(self.duplicate_threshold)
+        if self.server_timing:
+            metrics = ['db;dur={:.1f};desc="{} queries"'.format(
+                           recorder.duration * 1000, recorder.count),
+                       'total;dur={:.1f}'.format(total * 1000)]
+            if render_time is not None:
+                metrics.append('render;dur={:.1f};desc="{} queries"'.format(
+                    render_time * 1000, recorder.render_count))
+            if duplicates:
+                metrics.append('dup;desc="{} repeated queries"'.format(
+                    sum(count for count, signature in duplicates)))
+            response['Server-Timing'] = ', '.join(metrics)
+
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(recorder.duration * 1000, 2),
+            'queries': recorder.count,
+            'render_ms': round(render_time * 1000, 2) if render_time is not None else None,
+            'render_queries': recorder.render_count,
+            'duplicates': [{'count': count, 'sql': signature}
+                           for count, signature in duplicates],
+        }))
+
+
+# encodings of precompressed variants, preferred first
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+ACCEPT_ENCODING_PATTERN = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+# one collected static file and its precompressed variants
+class StaticFile(object):
+    def __init__(self, path, immutable):
+        self.path = path
+        self.immutable = immutable
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        stat = os.stat(path)
+        self.last_modified = int(stat.st_mtime)
+        self.etag = '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+        self.variants = [(encoding, path + extension)
+                         for encoding, extension in STATIC_ENCODINGS
+                         if os.path.exists(path + extension)]
+
+    def get_variant(self, accept_encoding):
+        accepted = set()
+        for match in ACCEPT_ENCODING_PATTERN.finditer(accept_encoding):
+            encoding, quality = match.groups()
+            try:
+                if quality is None or float(quality) > 0:
+                    accepted.add(encoding.lower())
+            except ValueError:
+                continue
+        for encoding, path in self.variants:
+            if encoding in accepted:
+                return encoding, path
+        return None, self.path
+
+
+# serves STATIC_ROOT after collectstatic from the application (no web
+# server for static files needed): hashed names from the manifest get
+# far-future Cache-Control, other files a short max-age, and clients get
+# the .br or .gz variant made by CompressedManifestStaticFilesStorage
+# according to Accept-Encoding. Files are indexed once at startup, run
+# collectstatic before starting the server. Not used without STATIC_ROOT
+class StaticFilesMiddleware(SyncAsyncMiddleware):
+    def __init__(self, get_response):
+        super(StaticFilesMiddleware, self).__init__(get_response)
+        root = getattr(settings, 'STATIC_ROOT', None)
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.prefix = settings.STATIC_URL
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+        self.files = self.index(str(root))
+
+    def index(self, root):
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        variants = tuple(extension for encoding, extension in STATIC_ENCODINGS)
+        files = {}
+        for directory, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name.endswith(variants) and os.path.exists(path[:-3]):
+                    continue
+                files[self.prefix + name] = StaticFile(path, name in hashed)
+        return files
+
+    def get_static_file(self, request):
+        if request.method not in ('GET', 'HEAD') or \
+                not request.path_info.startswith(self.prefix):
+            return None
+        return self.files.get(request.path_info)
+
+    def call(self, request):
+        static_file = self.get_static_file(request)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    # files are only opened here, the response streams them
+    async def acall(self, request):
+        static_file = self.get_static_file(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        encoding, path = static_file.get_variant(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = static_file.etag
+        if encoding is not None:
+            etag = '{}-{}"'.format(etag[:-1], encoding)
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=static_file.last_modified)
+        if response is None:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type=static_file.content_type)
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(static_file.last_modified)
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'public, max-age={}'.format(self.max_age)
+        return response
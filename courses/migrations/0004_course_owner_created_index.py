@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_auto_20201007_2205'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['owner', '-created', '-id'], name='courses_cou_owner_i_e14aad_idx'),
+        ),
+    ]
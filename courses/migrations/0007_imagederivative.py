@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-16 22:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant', models.CharField(max_length=50)),
+                ('file', models.FileField(max_length=255, upload_to='images/derived')),
+                ('source_updated', models.DateTimeField()),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='courses.image')),
+            ],
+            options={
+                'unique_together': {('image', 'variant')},
+            },
+        ),
+    ]
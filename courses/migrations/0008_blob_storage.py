@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-16 22:42
+
+import courses.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_imagederivative'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(storage=courses.storage.ContentAddressedStorage(), upload_to='files'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(storage=courses.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+    ]
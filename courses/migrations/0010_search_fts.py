@@ -0,0 +1,69 @@
+from django.db import migrations, OperationalError
+
+
+# full-text index of search documents on SQLite (FTS5), kept in sync with
+# courses_searchdocument by triggers; other databases use SearchPosting
+# (a later migration rebuilding courses_searchdocument on SQLite drops the
+# triggers, it has to create them again)
+CREATE_SQL = [
+    '''CREATE VIRTUAL TABLE courses_search_fts USING fts5(
+           title, body,
+           content='courses_searchdocument', content_rowid='id')''',
+    '''CREATE TRIGGER courses_search_fts_insert
+       AFTER INSERT ON courses_searchdocument BEGIN
+           INSERT INTO courses_search_fts(rowid, title, body)
+           VALUES (new.id, new.title, new.body);
+       END''',
+    '''CREATE TRIGGER courses_search_fts_delete
+       AFTER DELETE ON courses_searchdocument BEGIN
+           INSERT INTO courses_search_fts(courses_search_fts, rowid, title, body)
+           VALUES ('delete', old.id, old.title, old.body);
+       END''',
+    '''CREATE TRIGGER courses_search_fts_update
+       AFTER UPDATE ON courses_searchdocument BEGIN
+           INSERT INTO courses_search_fts(courses_search_fts, rowid, title, body)
+           VALUES ('delete', old.id, old.title, old.body);
+           INSERT INTO courses_search_fts(rowid, title, body)
+           VALUES (new.id, new.title, new.body);
+       END''',
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS courses_search_fts_insert',
+    'DROP TRIGGER IF EXISTS courses_search_fts_delete',
+    'DROP TRIGGER IF EXISTS courses_search_fts_update',
+    'DROP TABLE IF EXISTS courses_search_fts',
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE courses_search_fts_check USING fts5(x)')
+            cursor.execute('DROP TABLE courses_search_fts_check')
+        except OperationalError:
+            # SQLite compiled without FTS5
+            return
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
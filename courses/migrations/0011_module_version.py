@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-16 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_search_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-16 23:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
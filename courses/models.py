@@ -1,8 +1,11 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.utils import timezone
 from .fields import OrderField
+from .storage import blob_storage
 
 
 # General category of course
@@ -17,6 +20,17 @@ class Subject(models.Model):
         return self.title
 
 
+class CourseQuerySet(models.QuerySet):
+    # number of modules and id of the first module as annotations,
+    # so the course list doesn't run COUNT/first queries for every row
+    def with_module_summary(self):
+        first_module = Module.objects.filter(course=models.OuterRef('pk')) \
+                                     .order_by('order') \
+                                     .values('id')[:1]
+        return self.annotate(module_count=models.Count('modules'),
+                             first_module_id=models.Subquery(first_module))
+
+
 # each subject have multiple courses
 class Course(models.Model):
     owner = models.ForeignKey(User,
@@ -30,8 +44,12 @@ class Course(models.Model):
     overview = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = CourseQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created', ]
+        # index for keyset pagination of owner's courses
+        indexes = [models.Index(fields=['owner', '-created', '-id'])]
 
     def __str__(self):
         return self.title
@@ -47,9 +65,13 @@ class Module(models.Model):
 
     # the order depends on the course
     order = OrderField(blank=True, for_fields=['course'])
+    # incremented on every save of the module, editors
+    # saving over a newer version get a conflict (see ModuleFormSet)
+    version = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['order']
+        indexes = [models.Index(fields=['course', 'order'])]
 
     def __str__(self):
         return '{}. {}'.format(self.order, self.title)
@@ -78,6 +100,17 @@ class Content(models.Model):
 
     class Meta:
         ordering = ['order']
+        indexes = [models.Index(fields=['module', 'order'])]
+
+
+# next free value of an OrderField for every scope (e.g. for contents
+# of one module), see OrderField.allocate
+class OrderSequence(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.key, self.value)
 
 
 # abstract model for all types to handle data
@@ -103,13 +136,126 @@ class Text(ItemBase):
     content = models.TextField()
 
 
+# files and images are stored once per unique content and shared by items
 class File(ItemBase):
-    file = models.FileField(upload_to='files')
+    file = models.FileField(upload_to='files', storage=blob_storage)
 
 
 class Image(ItemBase):
-    image = models.ImageField(upload_to='images')
+    image = models.ImageField(upload_to='images', storage=blob_storage)
 
 
 class Video(ItemBase):
     url = models.URLField()
+
+
+# resized/compressed version of an Image (see courses.derivatives)
+# file names contain a hash of the data, so they can be cached forever
+class ImageDerivative(models.Model):
+    image = models.ForeignKey(Image,
+                              related_name='derivatives',
+                              on_delete=models.CASCADE)
+    variant = models.CharField(max_length=50)
+    file = models.FileField(upload_to='images/derived', max_length=255)
+    # Image.updated of the source when this derivative was generated
+    source_updated = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['image', 'variant']
+
+    def __str__(self):
+        return '{} ({})'.format(self.image, self.variant)
+
+
+# file or image sent in chunks, the item and its content in the module
+# are created when the last chunk is stored (see courses.uploads)
+class ChunkedUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User,
+                              related_name='chunked_uploads',
+                              on_delete=models.CASCADE)
+    module = models.ForeignKey(Module,
+                               related_name='uploads',
+                               on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=50)
+    title = models.CharField(max_length=250)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # bytes received so far
+    offset = models.PositiveBigIntegerField(default=0)
+    # sha256 chain of received chunks: sha256(previous + chunk sha256)
+    checksum = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # time of the last received chunk, unfinished uploads expire after it
+    updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '{} ({}/{})'.format(self.filename, self.offset, self.size)
+
+
+# searchable text of a course, module or text item in one course
+# (see courses.search), used for snippets of search results
+class SearchDocument(models.Model):
+    kind = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    course = models.ForeignKey(Course,
+                               related_name='search_documents',
+                               on_delete=models.CASCADE)
+    title = models.CharField(max_length=250)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ['kind', 'object_id', 'course']
+
+    def __str__(self):
+        return '{} {}'.format(self.kind, self.title)
+
+
+# inverted index: a term of a search document with its weight,
+# used when the database has no full-text search
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    course = models.ForeignKey(Course,
+                               related_name='search_postings',
+                               on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['term', 'course']),
+                   models.Index(fields=['kind', 'object_id'])]
+
+    def __str__(self):
+        return self.term
+
+
+# background work queued by requests and run by workers (see courses.tasks),
+# a claimed task is leased to one worker until locked_until
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'),
+                      (RUNNING, 'Running'),
+                      (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # higher priorities run first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # not run before, set again with a delay when a failed attempt is retried
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', '-priority', 'run_at'])]
+
+    def __str__(self):
+        return '{} ({})'.format(self.name, self.status)
@@ -0,0 +1,103 @@
+from django.core.exceptions import PermissionDenied
+from django.db import router, transaction
+
+
+# largest order accepted from clients (PositiveIntegerField on every backend)
+MAX_ORDER = 2147483647
+
+# read the body of an order request, two formats are accepted:
+# - full list {"<id>": <order>, ...} (sent by older clients)
+# - compact move {"id": <id>, "new_index": <index>} or a list of moves
+def parse_order_request(data):
+    if isinstance(data, dict) and 'id' in data and 'new_index' in data:
+        data = [data]
+    try:
+        if isinstance(data, list):
+            return None, [(int(move['id']), int(move['new_index']))
+                          for move in data]
+        if isinstance(data, dict):
+            orders = {int(id): int(order) for id, order in data.items()}
+            # moves are clamped to the scope, explicit orders must fit the column
+            if all(0 <= order <= MAX_ORDER for order in orders.values()):
+                return orders, None
+    except (KeyError, TypeError, ValueError):
+        pass
+    raise ValueError('Invalid order request')
+
+
+# apply new orders to objects from "queryset" (already filtered by owner,
+# or checked with "check_scopes", a callable getting the scope ids)
+# ownership of all ids is checked with one query, rows whose order didn't
+# change are skipped and the rest is written with one bulk_update
+# (UPDATE ... SET order = CASE WHEN ...) in a single transaction
+# returns changed objects and ids of their scopes (e.g. courses of modules)
+def reorder(queryset, data, scope_field, order_field='order', check_scopes=None):
+    orders, moves = parse_order_request(data)
+    model = queryset.model
+    scope_attname = model._meta.get_field(scope_field).attname
+    if moves is not None:
+        orders, scopes, last = resolve_moves(queryset, moves, scope_attname,
+                                             order_field, check_scopes)
+    else:
+        rows = queryset.filter(id__in=orders) \
+                       .values_list('id', order_field, scope_attname)
+        current = {id: (order, scope) for id, order, scope in rows}
+        if len(current) != len(orders):
+            raise PermissionDenied
+        if check_scopes is not None and \
+                not check_scopes(set(scope for order, scope in current.values())):
+            raise PermissionDenied
+        orders = {id: order for id, order in orders.items()
+                  if current[id][0] != order}
+        scopes = set(current[id][1] for id in orders)
+        last = {}
+        for id, order in orders.items():
+            scope = current[id][1]
+            last[scope] = max(order, last.get(scope, order))
+
+    changed = [model(id=id, **{order_field: order})
+               for id, order in orders.items()]
+    if changed:
+        with transaction.atomic(using=router.db_for_write(model)):
+            model._default_manager.bulk_update(changed, [order_field])
+            # new objects get orders after the largest written one
+            model._meta.get_field(order_field).bump_scopes(last)
+    return changed, scopes
+
+
+# turn moves into new orders, the objects of every touched scope are
+# numbered by their position and only the changed ones are returned,
+# with the scopes and the last position of every scope
+def resolve_moves(queryset, moves, scope_attname, order_field, check_scopes=None):
+    model = queryset.model
+    ids = set(id for id, index in moves)
+    scopes = dict(queryset.filter(id__in=ids)
+                          .values_list('id', scope_attname))
+    if len(scopes) != len(ids):
+        raise PermissionDenied
+    if check_scopes is not None and not check_scopes(set(scopes.values())):
+        raise PermissionDenied
+
+    # current ordering of every scope touched by the moves
+    siblings = {}
+    current = {}
+    rows = model._default_manager.filter(**{
+        '{}__in'.format(scope_attname): set(scopes.values())
+    }).order_by(scope_attname, order_field, 'id') \
+      .values_list('id', scope_attname, order_field)
+    for id, scope, order in rows:
+        siblings.setdefault(scope, []).append(id)
+        current[id] = order
+
+    for id, index in moves:
+        ordered = siblings[scopes[id]]
+        ordered.remove(id)
+        index = max(0, min(index, len(ordered)))
+        ordered.insert(index, id)
+
+    orders = {id: index
+              for ordered in siblings.values()
+              for index, id in enumerate(ordered)
+              if current[id] != index}
+    last = {scope: len(ordered) - 1 for scope, ordered in siblings.items()}
+    return orders, set(scopes.values()), last
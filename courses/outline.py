@@ -0,0 +1,154 @@
+import hashlib
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Course, Module, Content
+
+
+# bump when the structure of the outline changes, old entries are ignored
+OUTLINE_VERSION = 3
+OUTLINE_TIMEOUT = getattr(settings, 'COURSE_OUTLINE_TIMEOUT', 60 * 60)
+
+
+def outline_key(course_id):
+    return 'course_outline:v{}:{}'.format(OUTLINE_VERSION, course_id)
+
+
+def module_course_key(module_id):
+    return 'course_outline:module:{}'.format(module_id)
+
+
+# time of the last change of a course, set when its outline is invalidated
+def course_modified_key(course_id):
+    return 'course_outline:modified:{}'.format(course_id)
+
+
+# denormalized course structure used by the module content pages:
+# course, its modules and for every module a summary of its contents,
+# with a validator (etag) and the time of the last change for HTTP caching
+class CourseOutline(object):
+    def __init__(self, data):
+        self.course = data['course']
+        self.modules = data['modules']
+        self.etag = data['etag']
+        self.modified = data['modified']
+
+    def get_module(self, module_id):
+        for module in self.modules:
+            if module['id'] == module_id:
+                return module
+        return None
+
+
+# read the outline from the database, contents of all modules are
+# loaded with one query and item titles with one IN query per content type
+def build_course_outline(course_id):
+    course = Course.objects.values('id', 'title', 'slug', 'owner_id',
+                                   'overview', 'created',
+                                   subject_title=F('subject__title'),
+                                   subject_slug=F('subject__slug')) \
+                           .get(id=course_id)
+    modules = list(Module.objects.filter(course_id=course_id)
+                                 .values('id', 'title', 'order'))
+    contents = list(Content.objects.filter(module__course_id=course_id)
+                                   .values('id', 'module_id', 'order',
+                                           'content_type_id', 'object_id'))
+
+    object_ids = {}
+    for content in contents:
+        object_ids.setdefault(content['content_type_id'], []) \
+                  .append(content['object_id'])
+    items = {}
+    for content_type_id, ids in object_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for item in model.objects.filter(id__in=ids) \
+                                 .values('id', 'title', 'updated'):
+            items[content_type_id, item['id']] = item
+
+    by_module = {module['id']: module for module in modules}
+    for module in modules:
+        module['contents'] = []
+    for content in contents:
+        item = items.get((content['content_type_id'], content['object_id']))
+        if item is None:
+            # bound item doesn't exist anymore
+            continue
+        by_module[content['module_id']]['contents'].append({
+            'id': content['id'],
+            'module_id': content['module_id'],
+            'order': content['order'],
+            'content_type_id': content['content_type_id'],
+            'model_name': ContentType.objects.get_for_id(
+                content['content_type_id']).model,
+            'item_id': item['id'],
+            'title': item['title'],
+            'updated': item['updated'],
+        })
+    for module in modules:
+        module['contents'].sort(key=lambda c: (c['order'], c['id']))
+
+    # course and module fields have no modification time, the time of
+    # the last invalidation covers them (or now when it was evicted)
+    modified = cache.get(course_modified_key(course_id))
+    if modified is None:
+        modified = timezone.now()
+        cache.add(course_modified_key(course_id), modified, None)
+    modified = max([modified, course['created']] +
+                   [content['updated'] for module in modules
+                    for content in module['contents']])
+    etag = hashlib.md5(repr((course, modules)).encode()).hexdigest()
+
+    data = {'course': course, 'modules': modules,
+            'etag': etag, 'modified': modified}
+    cache.set(outline_key(course_id), data, OUTLINE_TIMEOUT)
+    cache.set_many({module_course_key(module['id']): course_id
+                    for module in modules}, OUTLINE_TIMEOUT)
+    return data
+
+
+# outline of a course, one cache hit when it was already built
+def get_course_outline(course_id):
+    data = cache.get(outline_key(course_id))
+    if data is None:
+        data = build_course_outline(course_id)
+    return CourseOutline(data)
+
+
+# id of the course of a module, mostly from cache
+def get_module_course_id(module_id):
+    course_id = cache.get(module_course_key(module_id))
+    if course_id is None:
+        course_id = Module.objects.filter(id=module_id) \
+                                  .values_list('course_id', flat=True) \
+                                  .first()
+        if course_id is not None:
+            cache.set(module_course_key(module_id), course_id,
+                      OUTLINE_TIMEOUT)
+    return course_id
+
+
+# drop cached outlines, now and once more after commit so an outline
+# rebuilt inside the transaction from old data doesn't stay in cache
+def invalidate_course_outline(course_ids):
+    course_ids = [course_id for course_id in set(course_ids)
+                  if course_id is not None]
+    if not course_ids:
+        return
+    keys = [outline_key(course_id) for course_id in course_ids]
+
+    def invalidate():
+        cache.delete_many(keys)
+        modified = timezone.now()
+        cache.set_many({course_modified_key(course_id): modified
+                        for course_id in course_ids}, None)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def invalidate_module_outline(module_ids):
+    invalidate_course_outline(get_module_course_id(module_id)
+                              for module_id in set(module_ids))
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Course, Module
+
+
+# bump when the structure of the cached ownership changes
+OWNERSHIP_VERSION = 1
+OWNERSHIP_TIMEOUT = getattr(settings, 'OWNERSHIP_CACHE_TIMEOUT', 60 * 60)
+
+
+def ownership_key(user_id):
+    return 'ownership:v{}:{}'.format(OWNERSHIP_VERSION, user_id)
+
+
+# owner of a course, used by signals to find whose ownership changed
+def course_owner_key(course_id):
+    return 'ownership:course:{}'.format(course_id)
+
+
+# ids of the courses and modules of one user, management views check
+# ownership with set membership instead of joins to the course owner.
+# Objects created with bulk queries (imports, module formsets) send no
+# signals, so an id which isn't found reloads the sets once from the
+# database before access is denied
+class Ownership(object):
+    def __init__(self, user_id, data, fresh=False):
+        self.user_id = user_id
+        self.courses = data['courses']
+        self.modules = data['modules']
+        self.fresh = fresh
+
+    def reload(self):
+        data = build_ownership(self.user_id)
+        self.courses = data['courses']
+        self.modules = data['modules']
+        self.fresh = True
+
+    def owns_course(self, course_id):
+        if course_id not in self.courses and not self.fresh:
+            self.reload()
+        return course_id in self.courses
+
+    # id of the course of an owned module, None for other modules
+    def get_module_course_id(self, module_id):
+        if module_id not in self.modules and not self.fresh:
+            self.reload()
+        return self.modules.get(module_id)
+
+    def owns_module(self, module_id):
+        return self.get_module_course_id(module_id) is not None
+
+    def owns_courses(self, course_ids):
+        return all(self.owns_course(course_id) for course_id in course_ids)
+
+    def owns_modules(self, module_ids):
+        return all(self.owns_module(module_id) for module_id in module_ids)
+
+
+def build_ownership(user_id):
+    data = {
+        'courses': set(Course.objects.filter(owner_id=user_id)
+                                     .order_by().values_list('id', flat=True)),
+        'modules': dict(Module.objects.filter(course__owner_id=user_id)
+                                      .order_by().values_list('id', 'course_id')),
+    }
+    cache.set(ownership_key(user_id), data, OWNERSHIP_TIMEOUT)
+    cache.set_many({course_owner_key(course_id): user_id
+                    for course_id in data['courses']}, OWNERSHIP_TIMEOUT)
+    return data
+
+
+# ownership of the user of a request, cached on the user object so
+# views and mixins of one request share it
+def get_ownership(user):
+    if not user.is_authenticated:
+        return Ownership(None, {'courses': set(), 'modules': {}}, fresh=True)
+    ownership = getattr(user, '_ownership', None)
+    if ownership is None:
+        data = cache.get(ownership_key(user.id))
+        fresh = data is None
+        if fresh:
+            data = build_ownership(user.id)
+        ownership = user._ownership = Ownership(user.id, data, fresh)
+    return ownership
+
+
+# owner ids of courses, mostly from cache
+def get_course_owner_ids(course_ids):
+    keys = {course_owner_key(course_id): course_id
+            for course_id in set(course_ids) if course_id is not None}
+    owners = {keys[key]: owner_id
+              for key, owner_id in cache.get_many(keys).items()}
+    missing = [course_id for course_id in keys.values() if course_id not in owners]
+    if missing:
+        found = dict(Course.objects.filter(id__in=missing)
+                                   .values_list('id', 'owner_id'))
+        cache.set_many({course_owner_key(course_id): owner_id
+                        for course_id, owner_id in found.items()},
+                       OWNERSHIP_TIMEOUT)
+        owners.update(found)
+    return owners
+
+
+# drop cached ownership, now and after commit like outlines
+def invalidate_ownership(user_ids):
+    keys = [ownership_key(user_id) for user_id in set(user_ids)
+            if user_id is not None]
+    if not keys:
+        return
+
+    def invalidate():
+        cache.delete_many(keys)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def invalidate_course_owners(course_ids):
+    invalidate_ownership(get_course_owner_ids(course_ids).values())
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from django.db.models import Q, QuerySet
+from django.http import Http404
+from django.utils import timezone
+from .db import read_to_async
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# a page of a keyset paginated list, the cursor of the last object
+# is used to fetch the next page
+class KeysetPage(object):
+    def __init__(self, object_list, next_cursor, cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+# seek pagination on "-created" (with id as tie breaker), instead of OFFSET
+# every page is an index range scan that starts after the last seen object,
+# so deep pages cost the same as the first one
+class KeysetPaginator(object):
+    def __init__(self, queryset, per_page, field='created'):
+        self.queryset = queryset.order_by('-{}'.format(field), '-id')
+        self.per_page = per_page
+        self.field = field
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        return '{}.{}'.format((value - EPOCH) // timedelta(microseconds=1),
+                              obj.id)
+
+    def decode_cursor(self, cursor):
+        try:
+            micros, id = cursor.split('.')
+            return EPOCH + timedelta(microseconds=int(micros)), int(id)
+        except (ValueError, OverflowError):
+            raise Http404('Invalid cursor')
+
+    def get_page_queryset(self, cursor):
+        qs = self.queryset
+        if cursor:
+            value, id = self.decode_cursor(cursor)
+            qs = qs.filter(Q(**{'{}__lt'.format(self.field): value}) |
+                           Q(**{self.field: value, 'id__lt': id}))
+        # fetch one more object to know if there is a next page
+        return qs[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        object_list = list(self.get_page_queryset(cursor))
+        return self.make_page(object_list, cursor)
+
+    # same as page() for async views, uses the async ORM when available
+    async def apage(self, cursor=None):
+        qs = self.get_page_queryset(cursor)
+        if hasattr(QuerySet, '__aiter__'):
+            object_list = [obj async for obj in qs]
+        else:
+            object_list = await read_to_async(list)(qs)
+        return self.make_page(object_list, cursor)
+
+    def make_page(self, object_list, cursor):
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = self.encode_cursor(object_list[-1])
+        return KeysetPage(object_list, next_cursor, cursor or None)
@@ -0,0 +1,40 @@
+from django.forms.models import modelform_factory
+
+
+# fields of ItemBase which are never edited in content forms
+EXCLUDED_FIELDS = ['owner', 'order', 'created', 'updated']
+
+
+# content types which can be added to modules, model and form class are
+# resolved once per process (when the app is ready) instead of on every request
+# other apps can add their own ItemBase subclasses with registry.register()
+class ContentRegistry(object):
+    def __init__(self):
+        self._models = {}
+        self._forms = {}
+
+    def register(self, model, form_class=None):
+        name = model._meta.model_name
+        if form_class is None:
+            form_class = modelform_factory(model, exclude=EXCLUDED_FIELDS)
+        self._models[name] = model
+        self._forms[name] = form_class
+        return model
+
+    def get_model(self, model_name):
+        return self._models.get(model_name)
+
+    def get_form_class(self, model_name):
+        return self._forms.get(model_name)
+
+    def model_names(self):
+        return list(self._models)
+
+    def models(self):
+        return list(self._models.values())
+
+    def __contains__(self, model_name):
+        return model_name in self._models
+
+
+registry = ContentRegistry()
@@ -0,0 +1,298 @@
+import math
+import re
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import (Course, Module, Content, Text,
+                     SearchDocument, SearchPosting)
+
+
+# full-text search over courses, modules and text contents
+# every searchable object is stored as a SearchDocument (one per course it
+# belongs to); on SQLite with FTS5 the documents are indexed by the
+# courses_search_fts table (kept in sync by triggers, see migration 0010),
+# on other databases by an inverted index of SearchPosting rows
+
+FTS_TABLE = 'courses_search_fts'
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+# course documents rank higher than modules and texts with the same terms
+KIND_WEIGHTS = {'course': 1.5, 'module': 1.0, 'text': 1.0}
+MAX_TERM_LENGTH = 50
+SNIPPET_WORDS = 12
+STOP_WORDS = set('a an and are as at be by for from in is it of on or the this to with'.split())
+# markers of matched terms in snippets, replaced by <b> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+
+class SearchHit(object):
+    def __init__(self, course, score, kind, object_id, snippet):
+        self.course = course
+        self.score = score
+        self.kind = kind
+        self.object_id = object_id
+        self.snippet = snippet
+
+    def __repr__(self):
+        return '<SearchHit {} {:.3f}>'.format(self.course, self.score)
+
+
+def tokenize(text):
+    return [term[:MAX_TERM_LENGTH]
+            for term in re.findall(r'\w+', text.lower())
+            if len(term) > 1 and term not in STOP_WORDS]
+
+
+_fts_available = {}
+
+
+def fts_available():
+    alias = connection.alias
+    if alias not in _fts_available:
+        _fts_available[alias] = connection.vendor == 'sqlite' and \
+            FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[alias]
+
+
+# documents
+
+def build_documents(kind, object_ids):
+    object_ids = list(object_ids)
+    if kind == 'course':
+        return [SearchDocument(kind=kind, object_id=row['id'], course_id=row['id'],
+                               title=row['title'], body=row['overview'])
+                for row in Course.objects.filter(id__in=object_ids)
+                                         .values('id', 'title', 'overview')]
+    if kind == 'module':
+        return [SearchDocument(kind=kind, object_id=row['id'], course_id=row['course_id'],
+                               title=row['title'], body=row['description'])
+                for row in Module.objects.filter(id__in=object_ids)
+                                         .values('id', 'course_id', 'title', 'description')]
+    if kind == 'text':
+        # a text is indexed once for every course using it
+        courses = {}
+        for object_id, course_id in Content.objects.filter(
+                content_type=ContentType.objects.get_for_model(Text),
+                object_id__in=object_ids).values_list('object_id', 'module__course_id').distinct():
+            courses.setdefault(object_id, []).append(course_id)
+        return [SearchDocument(kind=kind, object_id=row['id'], course_id=course_id,
+                               title=row['title'], body=row['content'])
+                for row in Text.objects.filter(id__in=courses)
+                                       .values('id', 'title', 'content')
+                for course_id in courses[row['id']]]
+    raise ValueError('Unknown document kind {}'.format(kind))
+
+
+def build_postings(document):
+    weights = {}
+    for field, field_weight in ((document.title, TITLE_WEIGHT),
+                                (document.body, BODY_WEIGHT)):
+        for term in tokenize(field):
+            weights[term] = weights.get(term, 0) + field_weight
+    kind_weight = KIND_WEIGHTS.get(document.kind, 1.0)
+    return [SearchPosting(term=term, kind=document.kind,
+                          object_id=document.object_id,
+                          course_id=document.course_id,
+                          # repeated terms count less and less
+                          weight=kind_weight * (1 + math.log(weight)))
+            for term, weight in weights.items()]
+
+
+# plain DELETEs, nothing depends on documents and postings and the
+# generic delete receivers would make the ORM load every row first
+def remove(kind, object_ids):
+    object_ids = list(object_ids)
+    for model in (SearchDocument, SearchPosting):
+        qs = model.objects.filter(kind=kind, object_id__in=object_ids)
+        qs._raw_delete(qs.db)
+
+
+# index documents of objects again, called from signals with one object
+# and from rebuild_search_index with batches
+def reindex(kind, object_ids, batch_size=1000):
+    object_ids = list(object_ids)
+    if not object_ids:
+        return 0
+    remove(kind, object_ids)
+    documents = build_documents(kind, object_ids)
+    SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+    if not fts_available():
+        postings = [posting for document in documents
+                    for posting in build_postings(document)]
+        SearchPosting.objects.bulk_create(postings, batch_size=batch_size)
+    return len(documents)
+
+
+# documents of one kind or of all kinds
+def clear(kind=None):
+    for model in (SearchDocument, SearchPosting):
+        qs = model.objects.all()
+        if kind is not None:
+            qs = qs.filter(kind=kind)
+        qs._raw_delete(qs.db)
+
+
+# search
+
+def highlight(text):
+    return mark_safe(escape(text).replace(MATCH_START, '<b>')
+                                 .replace(MATCH_END, '</b>'))
+
+
+# words around the first matched term, with matched terms marked
+def make_snippet(text, terms):
+    words = text.split()
+    first = 0
+    for index, word in enumerate(words):
+        if set(tokenize(word)) & terms:
+            first = index
+            break
+    start = max(0, first - SNIPPET_WORDS // 3)
+    parts = []
+    for word in words[start:start + SNIPPET_WORDS]:
+        if set(tokenize(word)) & terms:
+            word = MATCH_START + word + MATCH_END
+        parts.append(word)
+    snippet = ' '.join(parts)
+    if start > 0:
+        snippet = '…' + snippet
+    if start + SNIPPET_WORDS < len(words):
+        snippet += '…'
+    return snippet
+
+
+# best document of every course is chosen in SQL (a course matching with
+# many documents doesn't push others out), snippets are made for these only
+def search_fts(terms, limit):
+    match = ' OR '.join('"{}"'.format(term) for term in terms)
+    kind_weight = 'CASE d.kind {} ELSE 1.0 END'.format(
+        ' '.join('WHEN %s THEN %s' for kind in KIND_WEIGHTS))
+    sql = '''
+        SELECT course_id, kind, object_id, document_id, score FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY course_id
+                                         ORDER BY score DESC) AS position
+            FROM (
+                -- bm25 is lower for better matches
+                SELECT d.course_id, d.kind, d.object_id, d.id AS document_id,
+                       -bm25({fts}, %s, %s) * {kind_weight} AS score
+                FROM {fts} JOIN courses_searchdocument d ON d.id = {fts}.rowid
+                WHERE {fts} MATCH %s
+            )
+        )
+        WHERE position = 1
+        ORDER BY score DESC
+        LIMIT %s
+    '''.format(fts=FTS_TABLE, kind_weight=kind_weight)
+    params = [TITLE_WEIGHT, BODY_WEIGHT]
+    for kind, weight in KIND_WEIGHTS.items():
+        params.extend([kind, weight])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [match, limit])
+        rows = cursor.fetchall()
+        if not rows:
+            return {}
+        cursor.execute('''
+            SELECT rowid, snippet({fts}, -1, %s, %s, '…', %s)
+            FROM {fts}
+            WHERE {fts} MATCH %s AND rowid IN ({ids})
+        '''.format(fts=FTS_TABLE, ids=', '.join(['%s'] * len(rows))),
+            [MATCH_START, MATCH_END, SNIPPET_WORDS, match] +
+            [row[3] for row in rows])
+        snippets = dict(cursor.fetchall())
+    return {course_id: (score, kind, object_id, snippets.get(document_id, ''))
+            for course_id, kind, object_id, document_id, score in rows}
+
+
+def search_postings(terms, limit):
+    postings = SearchPosting.objects.filter(term__in=terms)
+    # rarer terms weigh more (inverse document frequency)
+    total = SearchDocument.objects.count() or 1
+    frequencies = dict(postings.values('term')
+                               .annotate(documents=models.Count('id'))
+                               .values_list('term', 'documents'))
+    if not frequencies:
+        return {}
+    score = models.Sum(models.Case(
+        *[models.When(term=term, then=models.F('weight') *
+                      math.log(1 + total / float(documents)))
+          for term, documents in frequencies.items()],
+        output_field=models.FloatField()))
+    courses = list(postings.values('course_id')
+                           .annotate(score=score)
+                           .order_by('-score')
+                           .values_list('course_id', 'score')[:limit])
+    if not courses:
+        return {}
+
+    # best document of every course, used for the snippet
+    best = {}
+    for course_id, kind, object_id, document_score in postings.filter(
+            course_id__in=[course_id for course_id, course_score in courses]) \
+            .values('course_id', 'kind', 'object_id') \
+            .annotate(score=score) \
+            .order_by('-score') \
+            .values_list('course_id', 'kind', 'object_id', 'score'):
+        best.setdefault(course_id, (kind, object_id))
+    documents = {}
+    query = models.Q()
+    for course_id, (kind, object_id) in best.items():
+        query |= models.Q(course_id=course_id, kind=kind, object_id=object_id)
+    for document in SearchDocument.objects.filter(query):
+        documents[document.course_id] = document
+
+    hits = {}
+    for course_id, course_score in courses:
+        kind, object_id = best[course_id]
+        document = documents.get(course_id)
+        text = ''
+        if document:
+            # the body unless only the title matched
+            text = document.body if set(tokenize(document.body)) & set(terms) \
+                else document.title
+        hits[course_id] = (course_score, kind, object_id,
+                           make_snippet(text, set(terms)))
+    return hits
+
+
+# ids of all courses with a document containing a word starting with one
+# of the terms (e.g. "pyth" finds "Python"), unranked, for filters
+def search_course_ids(query):
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    if fts_available():
+        match = ' OR '.join('"{}"*'.format(term) for term in terms)
+        sql = '''
+            SELECT DISTINCT d.course_id
+            FROM {fts} JOIN courses_searchdocument d ON d.id = {fts}.rowid
+            WHERE {fts} MATCH %s
+        '''.format(fts=FTS_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match])
+            return [row[0] for row in cursor.fetchall()]
+    query = models.Q()
+    for term in terms:
+        query |= models.Q(term__startswith=term)
+    return list(SearchPosting.objects.filter(query)
+                                     .values_list('course_id', flat=True)
+                                     .distinct())
+
+
+# courses matching the query, best first, with a highlighted snippet
+# of the best matching course, module or text
+def search_courses(query, limit=20):
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    if fts_available():
+        hits = search_fts(terms, limit)
+    else:
+        hits = search_postings(terms, limit)
+    courses = Course.objects.select_related('subject', 'owner').in_bulk(list(hits))
+    results = [SearchHit(courses[course_id], score, kind, object_id, highlight(snippet))
+               for course_id, (score, kind, object_id, snippet) in hits.items()
+               if course_id in courses]
+    results.sort(key=lambda hit: -hit.score)
+    return results
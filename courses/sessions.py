@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+# cached_db sessions (read from cache, written to cache and database) which
+# skip the write when the data didn't change since it was loaded, e.g. a
+# view setting a key to the value it already has marks the session as
+# modified. With SESSION_SAVE_EVERY_REQUEST every request still writes, it
+# is the way to refresh the expiry
+class SessionStore(CachedDBStore):
+    loaded_state = None
+
+    def load(self):
+        data = super(SessionStore, self).load()
+        self.loaded_state = self.get_state(data)
+        return data
+
+    def get_state(self, data):
+        return self.serializer().dumps(data)
+
+    def is_unchanged(self):
+        return self.loaded_state is not None and \
+            not getattr(settings, 'SESSION_SAVE_EVERY_REQUEST', False) and \
+            self.get_state(self._get_session()) == self.loaded_state
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key is not None and self.is_unchanged():
+            return
+        super(SessionStore, self).save(must_create)
+        self.loaded_state = self.get_state(self._get_session())
@@ -0,0 +1,249 @@
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Subject, Course, Module, Content, Text, ImageDerivative
+from .outline import (OUTLINE_TIMEOUT, module_course_key,
+                      get_module_course_id, invalidate_course_outline,
+                      invalidate_module_outline)
+from .registry import registry
+from .blobs import blob_fields, release_blobs
+from .catalog import touch_catalog
+from .ownership import (OWNERSHIP_TIMEOUT, course_owner_key, get_course_owner_ids,
+                        invalidate_course_owners, invalidate_ownership)
+from .backends import (invalidate_users, invalidate_permissions,
+                       invalidate_all_permissions)
+from . import search
+
+
+# keep cached course outlines in sync with the database
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    invalidate_course_outline([instance.id])
+
+
+# modules edited outside of the module formset (e.g. in the admin) get
+# a new version too, so open formsets see the conflict
+@receiver(pre_save, sender=Module)
+def module_version(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    # saves of some fields only (e.g. order) keep the version
+    if update_fields is None:
+        instance.version += 1
+
+
+@receiver(post_save, sender=Module)
+def module_saved(sender, instance, **kwargs):
+    # the module could be moved to another course, refresh both
+    invalidate_course_outline([get_module_course_id(instance.id),
+                               instance.course_id])
+    cache.set(module_course_key(instance.id), instance.course_id,
+              OUTLINE_TIMEOUT)
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted(sender, instance, **kwargs):
+    invalidate_course_outline([instance.course_id])
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_changed(sender, instance, **kwargs):
+    invalidate_module_outline([instance.module_id])
+
+
+# subject titles are part of course outlines
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, **kwargs):
+    invalidate_course_outline(instance.courses.values_list('id', flat=True))
+
+
+# public catalog pages list subjects, courses and numbers of modules
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def catalog_changed(sender, instance, **kwargs):
+    touch_catalog()
+
+
+# items (text/video/image/file) are shown by title in outlines,
+# any model from the content registry is handled
+@receiver(post_save)
+@receiver(post_delete)
+def item_changed(sender, instance, **kwargs):
+    if registry.get_model(sender._meta.model_name) is not sender:
+        return
+    content_type = ContentType.objects.get_for_model(sender)
+    module_ids = Content.objects.filter(content_type=content_type,
+                                        object_id=instance.id) \
+                                .values_list('module_id', flat=True)
+    invalidate_module_outline(module_ids)
+
+
+# blobs of files and images are released when items stop using them,
+# they are deleted after commit if no other item uses the same blob
+
+def get_blob_field_names(sender):
+    return [field_name for model, field_name in blob_fields()
+            if model is sender]
+
+
+@receiver(pre_save)
+def item_blob_replaced(sender, instance, **kwargs):
+    field_names = get_blob_field_names(sender)
+    if not field_names or instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*field_names).first()
+    if old:
+        instance._replaced_blobs = [old[name] for name in field_names
+                                    if old[name] != getattr(instance, name).name]
+
+
+@receiver(post_save)
+def item_blob_saved(sender, instance, **kwargs):
+    replaced = getattr(instance, '_replaced_blobs', None)
+    if replaced:
+        release_blobs(replaced)
+        instance._replaced_blobs = None
+
+
+@receiver(post_delete)
+def item_blob_deleted(sender, instance, **kwargs):
+    field_names = get_blob_field_names(sender)
+    if field_names:
+        release_blobs([getattr(instance, name).name for name in field_names])
+
+
+@receiver(post_delete, sender=ImageDerivative)
+def derivative_deleted(sender, instance, **kwargs):
+    release_blobs([instance.file.name], group='derivatives')
+
+
+# search documents of courses, modules and texts
+
+@receiver(post_save, sender=Course)
+def course_search_saved(sender, instance, **kwargs):
+    search.reindex('course', [instance.id])
+
+
+@receiver(post_save, sender=Module)
+def module_search_saved(sender, instance, **kwargs):
+    search.reindex('module', [instance.id])
+
+
+@receiver(post_delete, sender=Module)
+def module_search_deleted(sender, instance, **kwargs):
+    search.remove('module', [instance.id])
+
+
+@receiver(post_save, sender=Text)
+def text_search_saved(sender, instance, **kwargs):
+    search.reindex('text', [instance.id])
+
+
+@receiver(post_delete, sender=Text)
+def text_search_deleted(sender, instance, **kwargs):
+    search.remove('text', [instance.id])
+
+
+# texts are indexed for every course using them
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_search_changed(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Text).id:
+        search.reindex('text', [instance.object_id])
+
+
+# cached ownership of management views (see courses.ownership), new courses
+# and modules are found by a reload, so only lost ownership is invalidated
+
+@receiver(pre_save, sender=Course)
+def course_owner_changing(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._previous_owner_id = get_course_owner_ids([instance.id]).get(instance.id)
+
+
+@receiver(post_save, sender=Course)
+def course_owner_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_owner_id', None)
+    if previous is not None and previous != instance.owner_id:
+        invalidate_ownership([previous, instance.owner_id])
+    cache.set(course_owner_key(instance.id), instance.owner_id, OWNERSHIP_TIMEOUT)
+
+
+@receiver(post_delete, sender=Course)
+def course_owner_deleted(sender, instance, **kwargs):
+    invalidate_ownership([instance.owner_id])
+    cache.delete(course_owner_key(instance.id))
+
+
+@receiver(pre_save, sender=Module)
+def module_course_changing(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._previous_course_id = get_module_course_id(instance.id)
+
+
+@receiver(post_save, sender=Module)
+def module_course_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_course_id', None)
+    if previous is not None and previous != instance.course_id:
+        invalidate_course_owners([previous, instance.course_id])
+
+
+@receiver(post_delete, sender=Module)
+def module_owner_deleted(sender, instance, **kwargs):
+    invalidate_course_owners([instance.course_id])
+
+
+# cached permissions of CachedModelBackend
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_permissions_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, User):
+        invalidate_permissions([instance.id])
+    elif action == 'post_clear':
+        # users of a cleared permission or group aren't known anymore
+        invalidate_all_permissions()
+    else:
+        invalidate_permissions(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_all_permissions()
+
+
+# cached users are dropped on every save (password, is_active, ...), the
+# permissions too unless only last_login changed (logins)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    invalidate_users([instance.id])
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_permissions([instance.id])
+
+
+@receiver(user_logged_out)
+def user_logged_out_cache(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_users([user.id])
+        invalidate_permissions([user.id])
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def permissions_deleted(sender, instance, **kwargs):
+    invalidate_all_permissions()
@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import tempfile
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import (MemoryFileUploadHandler,
+                                             TemporaryFileUploadHandler)
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# content addressed storage, every file is stored once under the sha256
+# of its data (blobs/ab/cd/abcd...ext), saving the same data again returns
+# the existing name. Rows share blobs, so files are never deleted by the
+# storage user directly, see courses.blobs
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    prefix = 'blobs'
+
+    def blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(self.prefix, digest[:2], digest[2:4],
+                              digest + extension)
+
+    def is_blob(self, name):
+        return name.startswith(self.prefix + '/')
+
+    # names are chosen by _save() from the data
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        # digest computed while the upload was received (see upload handlers)
+        digest = getattr(content, 'sha256', None)
+        if hasattr(content, 'temporary_file_path'):
+            if digest is None:
+                digest = self.hash_file(content)
+            name = self.blob_name(digest, name)
+            if self.exists(name):
+                self.touch(name)
+            else:
+                full_path = self.path(name)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # same name means same data, overwriting is harmless
+                file_move_safe(content.temporary_file_path(), full_path,
+                               allow_overwrite=True)
+                self.set_permissions(full_path)
+            return name
+
+        if digest is not None:
+            name = self.blob_name(digest, name)
+            if self.exists(name):
+                self.touch(name)
+                return name
+
+        # hash and copy in one pass, then move into place
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            sha256 = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    f.write(chunk)
+            name = self.blob_name(sha256.hexdigest(), name)
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(temp_path, full_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.set_permissions(full_path)
+        return name
+
+    # reused blobs get a new modification time, so a cleanup running
+    # before the new row is committed leaves them alone
+    def touch(self, name):
+        os.utime(self.path(name))
+
+    def hash_file(self, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def set_permissions(self, full_path):
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+# upload handlers computing sha256 of files while they are received,
+# ContentAddressedStorage uses it instead of reading the file again
+class HashingUploadMixin(object):
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super(HashingUploadMixin, self).new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        file = super(HashingUploadMixin, self).file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin,
+                                     MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            self.sha256.update(raw_data)
+        return super(HashingMemoryFileUploadHandler,
+                     self).receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin,
+                                        TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super(HashingTemporaryFileUploadHandler,
+                     self).receive_data_chunk(raw_data, start)
+
+
+# static files with hashed names (css/base.3f2a....css) from the manifest,
+# text files are compressed by collectstatic into .gz and, when the brotli
+# package is installed, .br files next to them; StaticFilesMiddleware
+# serves the variant the client accepts, nothing is compressed per request
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    compressed_extensions = ('.css', '.js', '.map', '.svg', '.txt', '.html',
+                             '.json', '.xml', '.ico', '.eot', '.ttf')
+    # variants saving less than this share of the size are not kept
+    minimum_saving = 0.05
+
+    # {% static %} before collectstatic ran (development, tests: there is no
+    # manifest) gives the unhashed name, names missing from a manifest are
+    # still errors
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super(CompressedManifestStaticFilesStorage, self).stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super(CompressedManifestStaticFilesStorage,
+                          self).post_process(paths, dry_run, **options)
+        for name, hashed_name, done in processed:
+            yield name, hashed_name, done
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.lower().endswith(self.compressed_extensions) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        variants = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for extension, compress in variants:
+            compressed = compress(data)
+            path = self.path(name + extension)
+            if len(compressed) > len(data) * (1 - self.minimum_saving):
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            with open(path, 'wb') as f:
+                f.write(compressed)
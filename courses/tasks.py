@@ -0,0 +1,212 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import traceback
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Task
+
+
+logger = logging.getLogger('courses.tasks')
+
+# seconds a claimed task belongs to its worker, after that another worker
+# may claim it again (the first one is considered dead)
+LEASE = getattr(settings, 'TASK_LEASE', 5 * 60)
+# seconds before the first retry of a failed task, doubled by every attempt
+RETRY_DELAY = getattr(settings, 'TASK_RETRY_DELAY', 30)
+MAX_ATTEMPTS = getattr(settings, 'TASK_MAX_ATTEMPTS', 3)
+# tasks claimed at once by a worker and seconds between polls of an empty queue
+BATCH_SIZE = getattr(settings, 'TASK_BATCH_SIZE', 10)
+POLL_INTERVAL = getattr(settings, 'TASK_POLL_INTERVAL', 1)
+
+# task functions by name
+_tasks = {}
+
+
+# register a function run by workers, it's called with the payload as
+# keyword arguments. Tasks run at least once (again after a crash or an
+# expired lease), so they must be safe to repeat
+def task(name):
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    return _tasks.get(name)
+
+
+# queue a task; the row is written in the current transaction, so workers
+# see it only when the transaction commits and never when it rolls back
+def enqueue(name, payload=None, priority=0, delay=0, max_attempts=None):
+    if name not in _tasks:
+        raise ValueError('Unknown task {}'.format(name))
+    return Task.objects.create(name=name,
+                               payload=payload or {},
+                               priority=priority,
+                               run_at=timezone.now() + timedelta(seconds=delay),
+                               max_attempts=max_attempts or MAX_ATTEMPTS)
+
+
+def get_queryset():
+    return Task.objects.using(router.db_for_write(Task))
+
+
+# queued tasks which are due and running tasks with an expired lease,
+# only tasks with one of "names" if given
+def claimable(now, names=None):
+    queryset = get_queryset().filter(Q(status=Task.QUEUED, run_at__lte=now) |
+                                     Q(status=Task.RUNNING, locked_until__lt=now,
+                                       attempts__lt=F('max_attempts')))
+    if names is not None:
+        queryset = queryset.filter(name__in=names)
+    return queryset
+
+
+# lease up to "limit" tasks to a new token, highest priority first. Where
+# the database skips locked rows they are selected FOR UPDATE, SQLite runs
+# one UPDATE with the selection as subquery (writers are serialized there)
+def claim(limit=BATCH_SIZE, lease=LEASE, names=None):
+    now = timezone.now()
+    queryset = get_queryset()
+    token = '{}-{}'.format(os.getpid(), uuid4().hex)
+    ids = claimable(now, names).order_by('-priority', 'run_at', 'id') \
+                               .values_list('id', flat=True)
+    with transaction.atomic(using=queryset.db):
+        if connections[queryset.db].features.has_select_for_update_skip_locked:
+            ids = list(ids.select_for_update(skip_locked=True)[:limit])
+        else:
+            ids = ids[:limit]
+        claimed = queryset.filter(id__in=ids).update(
+            status=Task.RUNNING,
+            locked_by=token,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1)
+    if not claimed:
+        return []
+    return list(queryset.filter(locked_by=token)
+                        .order_by('-priority', 'run_at', 'id'))
+
+
+# a task whose worker died at its last attempt is not claimed again
+def fail_expired():
+    return get_queryset().filter(status=Task.RUNNING,
+                                 locked_until__lt=timezone.now(),
+                                 attempts__gte=F('max_attempts')) \
+                         .update(status=Task.FAILED,
+                                 last_error='Lease expired',
+                                 locked_by='',
+                                 locked_until=None)
+
+
+# failed attempts are retried later with an exponential backoff, the
+# last one marks the task failed (kept with its error for inspection)
+def retry_or_fail(task, error):
+    queryset = get_queryset().filter(id=task.id, locked_by=task.locked_by)
+    if task.attempts >= task.max_attempts:
+        return queryset.update(status=Task.FAILED,
+                               last_error=error,
+                               locked_by='',
+                               locked_until=None)
+    delay = RETRY_DELAY * 2 ** (task.attempts - 1)
+    return queryset.update(status=Task.QUEUED,
+                           run_at=timezone.now() + timedelta(seconds=delay),
+                           last_error=error,
+                           locked_by='',
+                           locked_until=None)
+
+
+# run a claimed task, done tasks are deleted. A task claimed again by another
+# worker in the meantime (expired lease) is left to that worker
+def run_task(task):
+    func = get_task(task.name)
+    try:
+        if func is None:
+            raise LookupError('Unknown task {}'.format(task.name))
+        func(**task.payload)
+    except Exception:
+        logger.exception('Task %s (%s) failed', task.id, task.name)
+        retry_or_fail(task, traceback.format_exc())
+        return False
+    get_queryset().filter(id=task.id, locked_by=task.locked_by).delete()
+    return True
+
+
+# claim and run tasks until "stop" (an Event) is set, "once" stops when no
+# task is due, "names" limits the worker to some tasks. Returns the number
+# of tasks run
+def run_worker(stop=None, batch_size=BATCH_SIZE, lease=LEASE,
+               poll_interval=POLL_INTERVAL, once=False, names=None):
+    stop = stop or threading.Event()
+    done = 0
+    while not stop.is_set():
+        fail_expired()
+        tasks = claim(batch_size, lease, names)
+        # the whole batch is run, unfinished tasks would wait for their lease
+        for task in tasks:
+            run_task(task)
+            done += 1
+        if not tasks:
+            if once:
+                break
+            stop.wait(poll_interval)
+    return done
+
+
+def _thread_worker(stop, counter, options):
+    try:
+        done = run_worker(stop, **options)
+        with counter.get_lock():
+            counter.value += done
+    finally:
+        # connection of the pool thread
+        connection.close()
+
+
+def _process_worker(stop, counter, options):
+    import django
+    # the parent stops the workers with "stop", Ctrl+C must not break a task
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+    _thread_worker(stop, counter, options)
+
+
+# run "workers" workers in threads (I/O bound tasks, one process) or in
+# processes (CPU bound tasks, not limited by the GIL) until "stop" is set,
+# or until the queue is empty with once=True. Returns the number of tasks run
+# processes started with "spawn" know only the tasks registered by the
+# modules imported by django.setup() (courses.apps), with "fork" they also
+# know the ones registered by the parent before
+def run_pool(workers, pool='thread', stop=None, **options):
+    context = multiprocessing.get_context()
+    if pool == 'process':
+        # database connections must not be shared with the children
+        connections.close_all()
+        Worker = context.Process
+        target = _process_worker
+    elif pool == 'thread':
+        Worker = threading.Thread
+        target = _thread_worker
+    else:
+        raise ValueError('Unknown pool {}'.format(pool))
+    stop = stop or context.Event()
+    counter = context.Value('i', 0)
+    pool = [Worker(target=target, args=(stop, counter, options), daemon=True)
+            for number in range(workers)]
+    for worker in pool:
+        worker.start()
+    try:
+        for worker in pool:
+            worker.join()
+    finally:
+        stop.set()
+        for worker in pool:
+            worker.join()
+    return counter.value
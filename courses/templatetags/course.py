@@ -1,4 +1,6 @@
 from django import template
+from django.urls import reverse
+from ..fragments import render_item_fragments
 
 register = template.Library()
 
@@ -9,3 +11,26 @@ def model_name(obj):
         return obj._meta.model_name
     except AttributeError:
         return None
+
+
+# url of a resized version of an Image, e.g. {{ image|image_variant:"thumbnail" }}
+@register.filter
+def image_variant(image, variant):
+    return reverse('image_derivative', args=[image.id, variant])
+
+
+# items with their HTML from the fragment cache (see courses.fragments),
+# {% item_fragments module.contents "template.html" "id" as fragments %}
+# gives (item, html) pairs, extra arguments name values of the items the
+# fragment depends on besides the item itself
+@register.simple_tag(takes_context=True)
+def item_fragments(context, items, template_name, *vary_names):
+    def vary(item):
+        if isinstance(item, dict):
+            return tuple(item[name] for name in vary_names)
+        return tuple(getattr(item, name) for name in vary_names)
+
+    items = list(items)
+    return list(zip(items, render_item_fragments(template_name, items,
+                                                 vary if vary_names else None,
+                                                 context.get('csrf_token'))))
@@ -1,3 +1,881 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User, Permission
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from .models import (Subject, Course, Module, Content,
+                     Text, Video, File, Image, ImageDerivative, OrderSequence,
+                     Task, ChunkedUpload)
+from .db import DatabaseRoutingMiddleware, PrimaryReplicaRouter
+from .middleware import RequestMetricsMiddleware, StaticFilesMiddleware
+from .fields import bulk_create_ordered
+from .forms import ModuleFormSet, VersionConflict
+from .fragments import CSRF_PLACEHOLDER
+from .storage import blob_storage
+from .transfer import TransferError, bulk_create_with_ids, export_course, import_course
+from . import derivatives, search, tasks, uploads
 
-# Create your tests here.
+
+# performance tests: upper bounds of SQL queries for every view and admin
+# changelist (an N+1 makes them fail) and timing benchmarks
+# set COURSES_BENCHMARK_OUTPUT to a file name to get benchmark results as JSON
+
+OWNERS = 3
+COURSES_PER_OWNER = 100
+MODULES_PER_COURSE = 3
+# mixed contents of the first module of the big course
+CONTENTS = {Text: 120, Video: 80, File: 50, Image: 50}
+
+
+# several owners, hundreds of courses and one course with a module
+# of hundreds of contents, inserted with bulk queries
+def create_catalog():
+    permissions = Permission.objects.filter(codename__in=['add_course',
+                                                          'change_course',
+                                                          'delete_course'])
+    owners = []
+    for number in range(OWNERS):
+        owner = User.objects.create_user('instructor{}'.format(number),
+                                         password='password')
+        owner.user_permissions.set(permissions)
+        owners.append(owner)
+    subjects = bulk_create_with_ids(Subject, [
+        Subject(title=title, slug=title.lower())
+        for title in ['Mathematics', 'Music', 'Physics', 'Programming']])
+
+    courses = bulk_create_with_ids(Course, [
+        Course(owner=owner, subject=subjects[number % len(subjects)],
+               title='Course {} of {}'.format(number, owner.username),
+               slug='course-{}-{}'.format(owner.id, number),
+               overview='Overview of course {}'.format(number))
+        for owner in owners for number in range(COURSES_PER_OWNER)])
+    modules = bulk_create_with_ids(Module, [
+        Module(course=course, title='Module {}'.format(order),
+               description='Description', order=order)
+        for course in courses for order in range(MODULES_PER_COURSE)])
+
+    big_course = courses[0]
+    module = modules[0]
+    contents = []
+    for model, count in CONTENTS.items():
+        items = []
+        for number in range(count):
+            item = model(owner=big_course.owner,
+                         title='{} {}'.format(model.__name__, number))
+            if model is Text:
+                item.content = 'Text content {}'.format(number)
+            elif model is Video:
+                item.url = 'https://example.com/videos/{}'.format(number)
+            elif model is File:
+                item.file = 'blobs/00/00/file{}.pdf'.format(number)
+            else:
+                item.image = 'blobs/00/00/image{}.png'.format(number)
+            items.append(item)
+        bulk_create_with_ids(model, items)
+        contents.extend(Content(module=module, item=item) for item in items)
+    for order, content in enumerate(contents):
+        content.order = order
+    Content.objects.bulk_create(contents)
+
+    search.reindex('course', [course.id for course in courses])
+    search.reindex('module', [module.id for module in modules])
+    return owners, subjects, courses, modules
+
+
+class CatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners, cls.subjects, cls.courses, cls.modules = create_catalog()
+        cls.owner = cls.owners[0]
+        cls.course = cls.courses[0]
+        cls.module = cls.modules[0]
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com',
+                                                  'password')
+
+    def setUp(self):
+        # every view is measured with cold caches
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def get_content(self, model=Text):
+        return Content.objects.filter(module=self.module,
+                                      content_type__model=model._meta.model_name) \
+                              .first()
+
+
+@contextmanager
+def max_queries(test, limit):
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if len(context) > limit:
+        test.fail('{} queries, at most {} expected:\n{}'.format(
+            len(context), limit,
+            '\n'.join(query['sql'] for query in context.captured_queries)))
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class ViewQueryCountTests(CatalogTestCase):
+    def assertQueries(self, limit, method, url, status=200, **kwargs):
+        with max_queries(self, limit):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    # manage courses
+
+    def test_manage_course_list(self):
+        response = self.assertQueries(5, 'get', reverse('manage_course_list'))
+        self.assertEqual(len(response.context['object_list']), 20)
+        cursor = response.context['page_obj'].next_cursor
+        self.assertQueries(5, 'get', reverse('manage_course_list'),
+                           data={'after': cursor})
+
+    def test_course_create(self):
+        self.assertQueries(6, 'get', reverse('course_create'))
+        # session, user and permissions from cache
+        self.assertQueries(1, 'get', reverse('course_create'))
+
+    def test_course_edit(self):
+        self.assertQueries(7, 'get', reverse('course_edit', args=[self.course.id]))
+
+    def test_course_delete(self):
+        self.assertQueries(6, 'get', reverse('course_delete', args=[self.course.id]))
+        # the big course, with its 300 contents and items
+        self.assertQueries(60, 'post', reverse('course_delete', args=[self.course.id]),
+                           status=302)
+        self.assertFalse(Content.objects.filter(module=self.module).exists())
+
+    def test_course_module_update(self):
+        url = reverse('course_module_update', args=[self.course.id])
+        self.assertQueries(6, 'get', url)
+        modules = list(Module.objects.filter(course=self.course))
+        data = {'modules-TOTAL_FORMS': len(modules) + 1,
+                'modules-INITIAL_FORMS': len(modules),
+                'modules-0-title': 'Changed',
+                'modules-{}-title'.format(len(modules)): 'New',
+                'modules-{}-description'.format(len(modules)): 'Description',
+                'modules-{}-version'.format(len(modules)): 1}
+        for number, module in enumerate(modules):
+            data.setdefault('modules-{}-title'.format(number), module.title)
+            data.update({'modules-{}-id'.format(number): module.id,
+                         'modules-{}-description'.format(number): module.description,
+                         'modules-{}-version'.format(number): module.version})
+        self.assertQueries(21, 'post', url, status=302, data=data)
+        self.assertEqual(Module.objects.get(id=modules[0].id).version, 2)
+        # the form of the first module has an old version now
+        response = self.assertQueries(6, 'post', url + '?page=1', data=data)
+        self.assertTrue(response.context['formset'].errors[0])
+        self.assertEqual(response.context['page_obj'].number, 1)
+        # changed after the forms were validated
+        data.update({'modules-0-title': 'Changed again', 'modules-0-version': 2})
+        formset = ModuleFormSet(instance=self.course, data=data,
+                                queryset=self.course.modules.all())
+        self.assertTrue(formset.is_valid())
+        Module.objects.filter(id=data['modules-0-id']).update(version=3)
+        with self.assertRaises(VersionConflict):
+            formset.save()
+        formset = ModuleFormSet(instance=self.course, data=data,
+                                queryset=self.course.modules.all(), conflict=True)
+        self.assertFalse(formset.is_valid())
+        self.assertIn('another editor', formset.non_form_errors()[0])
+
+    def test_course_export(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            names = list(File.objects.values_list('file', flat=True)) + \
+                list(Image.objects.values_list('image', flat=True))
+            for name in names:
+                os.makedirs(os.path.dirname(blob_storage.path(name)), exist_ok=True)
+                with open(blob_storage.path(name), 'wb') as f:
+                    f.write(b'data')
+            with max_queries(self, 15):
+                response = self.client.get(reverse('course_export',
+                                                   args=[self.course.id]))
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_clone(self):
+        self.assertQueries(6, 'get', reverse('course_clone', args=[self.course.id]))
+        self.assertQueries(70, 'post', reverse('course_clone', args=[self.course.id]),
+                           status=302, data={'title': 'Copy', 'slug': 'copy'})
+        self.assertEqual(Content.objects.filter(module__course__slug='copy').count(),
+                         sum(CONTENTS.values()))
+
+    def test_course_import(self):
+        self.assertQueries(5, 'get', reverse('course_import'))
+
+    # contents
+
+    def test_module_content_list(self):
+        response = self.assertQueries(11, 'get', reverse('module_content_list',
+                                                        args=[self.module.id]))
+        self.assertEqual(len(response.context['module']['contents']),
+                         sum(CONTENTS.values()))
+        # session, user, outline, ownership and rendered items from cache
+        response = self.assertQueries(0, 'get', reverse('module_content_list',
+                                                        args=[self.module.id]))
+        self.assertContains(response, response.context['csrf_token'],
+                            count=sum(CONTENTS.values()))
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        # a saved item is rendered again
+        text = Text.objects.get(id=self.get_content().object_id)
+        text.title = 'Renamed text'
+        text.save()
+        self.assertContains(self.client.get(reverse('module_content_list',
+                                                    args=[self.module.id])),
+                            'Renamed text')
+        # modules of other owners are not found in the ownership
+        self.assertQueries(4, 'get', reverse('module_content_list',
+                                             args=[self.modules[-1].id]), status=404)
+
+    def test_module_content_create(self):
+        url = reverse('module_content_create', args=[self.module.id, 'text'])
+        self.assertQueries(4, 'get', url)
+        self.assertQueries(0, 'get', url)
+        self.assertQueries(20, 'post', url, status=302,
+                           data={'title': 'New text', 'content': 'Body'})
+
+    def test_module_content_update(self):
+        content = self.get_content()
+        url = reverse('module_content_update',
+                      args=[self.module.id, 'text', content.object_id])
+        self.assertQueries(5, 'get', url)
+        self.assertQueries(20, 'post', url, status=302,
+                           data={'title': 'Changed', 'content': 'Body'})
+
+    def test_module_content_delete(self):
+        content = self.get_content(File)
+        self.assertQueries(15, 'post', reverse('module_content_delete',
+                                               args=[content.id]), status=302)
+        # the item is deleted by a worker
+        self.assertTrue(File.objects.filter(id=content.object_id).exists())
+        tasks.run_worker(once=True)
+        self.assertFalse(File.objects.filter(id=content.object_id).exists())
+
+    def test_image_derivative_of_other_owner(self):
+        image_id = self.get_content(Image).object_id
+        self.client.force_login(self.owners[1])
+        self.assertQueries(3, 'get', reverse('image_derivative',
+                                             args=[image_id, 'thumbnail']), status=404)
+
+    def test_image_derivative(self):
+        image = Image.objects.get(id=self.get_content(Image).object_id)
+        ImageDerivative.objects.create(image=image, variant='thumbnail',
+                                       file='images/derived/thumbnail.jpg',
+                                       source_updated=image.updated)
+        self.assertQueries(3, 'get', reverse('image_derivative',
+                                             args=[image.id, 'thumbnail']), status=302)
+
+    def test_chunked_upload(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                tempfile.TemporaryDirectory() as upload_dir, \
+                override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=upload_dir):
+            url = reverse('module_content_upload', args=[self.module.id, 'file'])
+            response = self.assertQueries(5, 'post', url, status=201,
+                                          data={'title': 'Upload', 'filename': 'a.pdf',
+                                                'size': 10},
+                                          content_type='application/json')
+            url = reverse('chunked_upload', args=[response.json()['id']])
+            self.assertQueries(3, 'get', url)
+            # a chunk, then the last chunk which creates the content
+            for offset, data, status, limit in ((0, b'hello', 200, 3),
+                                                (5, b'world', 201, 16)):
+                self.assertQueries(limit, 'put', url, status=status, data=data,
+                                   content_type='application/octet-stream',
+                                   HTTP_X_UPLOAD_OFFSET=str(offset),
+                                   HTTP_X_CHUNK_CHECKSUM=hashlib.sha256(data).hexdigest())
+
+    def test_module_order(self):
+        module = Module.objects.filter(course=self.course).last()
+        self.assertQueries(10, 'post', reverse('module_order'),
+                           data={'id': module.id, 'new_index': 0},
+                           content_type='application/json')
+
+    def test_content_order(self):
+        content = Content.objects.filter(module=self.module).last()
+        self.assertQueries(10, 'post', reverse('content_order'),
+                           data={'id': content.id, 'new_index': 0},
+                           content_type='application/json')
+
+    # async views
+
+    @override_settings(ASYNC_READS_THREAD_SENSITIVE=True)
+    def test_async_views(self):
+        self.assertQueries(5, 'get', reverse('manage_course_list_async'))
+        self.assertQueries(11, 'get', reverse('module_content_list_async',
+                                             args=[self.module.id]))
+        content = Content.objects.filter(module=self.module).last()
+        self.assertQueries(10, 'post', reverse('content_order_async'),
+                           data={'id': content.id, 'new_index': 0},
+                           content_type='application/json')
+        module = Module.objects.filter(course=self.course).last()
+        self.assertQueries(10, 'post', reverse('module_order_async'),
+                           data={'id': module.id, 'new_index': 0},
+                           content_type='application/json')
+        # inherited synchronous handlers
+        self.assertQueries(3, 'options', reverse('module_order_async'))
+
+    # public catalog
+
+    def test_course_list(self):
+        self.client.logout()
+        response = self.assertQueries(3, 'get', reverse('course_list'))
+        # fragments and 304 from cache
+        self.assertQueries(0, 'get', reverse('course_list'))
+        self.assertQueries(0, 'get', reverse('course_list'), status=304,
+                           HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_course_list_subject(self):
+        self.client.logout()
+        self.assertQueries(3, 'get', reverse('course_list_subject',
+                                             args=[self.subjects[0].slug]))
+
+    def test_course_detail(self):
+        self.client.logout()
+        url = reverse('course_detail', args=[self.course.slug])
+        response = self.assertQueries(8, 'get', url)
+        self.assertQueries(1, 'get', url, status=304,
+                           HTTP_IF_NONE_MATCH=response['ETag'])
+        # slugs of management paths open the course page too
+        for slug in ('mine', 'create', 'import', 'edit'):
+            self.assertEqual(resolve(reverse('course_detail', args=[slug])).url_name,
+                             'course_detail')
+
+    # admin
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        # queued tasks for the task changelist
+        for number in range(20):
+            tasks.enqueue('delete_items', {'content_type_id': 1, 'object_ids': [number]})
+        for model in ['subject', 'course', 'module', 'task']:
+            self.assertQueries(8, 'get', reverse('admin:courses_{}_changelist'.format(model)))
+        self.assertQueries(10, 'get', reverse('admin:courses_course_changelist'),
+                           data={'q': 'course'})
+
+    def test_admin_module_inline(self):
+        self.client.force_login(self.admin)
+        course = self.courses[1]
+        modules = list(course.modules.all())
+        url = reverse('admin:courses_course_change', args=[course.id])
+        self.assertNotContains(self.client.get(url), 'name="modules-0-version"')
+        data = {'owner': course.owner_id, 'subject': course.subject_id,
+                'title': course.title, 'slug': course.slug, 'overview': course.overview,
+                'modules-TOTAL_FORMS': len(modules), 'modules-INITIAL_FORMS': len(modules)}
+        for number, module in enumerate(modules):
+            data.update({'modules-{}-id'.format(number): module.id,
+                         'modules-{}-course'.format(number): course.id,
+                         'modules-{}-title'.format(number): module.title,
+                         'modules-{}-description'.format(number): module.description,
+                         'modules-{}-order'.format(number): module.order})
+        data['modules-0-title'] = 'Changed'
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        # open module forms of the changed module get a conflict
+        self.assertEqual([module.version for module in course.modules.all()], [2, 1, 1])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_ROUTER_APPS=['courses'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def get_aliases(self, request):
+        router = PrimaryReplicaRouter()
+        aliases = [router.db_for_read(Course), router.db_for_read(User)]
+        router.db_for_write(Module)
+        return aliases + [router.db_for_read(Course)]
+
+    def route(self, method):
+        middleware = DatabaseRoutingMiddleware(self.get_aliases)
+        return middleware(getattr(RequestFactory(), method)('/'))
+
+    def test_reads_own_writes(self):
+        self.assertEqual(self.route('get'), ['replica1', 'default', 'default'])
+        # unsafe requests read from the primary
+        self.assertEqual(self.route('post'), ['default', 'default', 'default'])
+
+    # ASGI requests stay on the event loop, writes in threads still pin
+    def test_async(self):
+        async def get_response(request):
+            return await sync_to_async(self.get_aliases)(request)
+
+        middleware = DatabaseRoutingMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(async_to_sync(middleware)(RequestFactory().get('/')),
+                         ['replica1', 'default', 'default'])
+
+
+class SessionUserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='password')
+        self.client.login(username='student', password='password')
+
+    def test_unchanged_session_not_saved(self):
+        session = self.client.session
+        session.load()
+        session['_auth_user_id'] = session['_auth_user_id']
+        with self.assertNumQueries(0):
+            session.save()
+        session['viewed'] = 1
+        with CaptureQueriesContext(connection) as context:
+            session.save()
+        self.assertIn('UPDATE', ' '.join(query['sql'] for query in context))
+
+    def test_user_invalidated(self):
+        url = reverse('manage_course_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).context['user'], self.user)
+        self.assertFalse([query for query in context
+                          if 'django_session' in query['sql'] or
+                          'auth_user' in query['sql']])
+        # other sessions are logged out by the new password hash
+        self.user.set_password('changed')
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTests(CatalogTestCase):
+    def test_metrics(self):
+        url = reverse('module_content_list', args=[self.module.id])
+        with self.assertLogs('courses.metrics') as logs:
+            response = self.client.get(url)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        metrics = json.loads(logs.records[0].getMessage())
+        self.assertEqual(metrics['view'], 'module_content_list')
+        self.assertEqual(metrics['duplicates'], [])
+        self.assertGreater(metrics['queries'], 0)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_disabled(self):
+        receivers = list(connection_created.receivers)
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestMetricsMiddleware(lambda request: None)
+        # queries are not wrapped
+        self.assertEqual(connection_created.receivers, receivers)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    def test_precompressed_variants(self):
+        with tempfile.TemporaryDirectory() as static_root, \
+                override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            middleware = StaticFilesMiddleware(lambda request: None)
+            url = staticfiles_storage.url('css/base.css')
+            self.assertNotEqual(url, '/static/css/base.css')
+            with self.assertRaises(ValueError):
+                staticfiles_storage.url('css/missing.css')
+
+            response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0'))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+
+            response = middleware(RequestFactory().get(url, HTTP_IF_NONE_MATCH=response['ETag'],
+                                                       HTTP_ACCEPT_ENCODING='gzip'))
+            self.assertEqual(response.status_code, 304)
+            response = middleware(RequestFactory().get('/static/css/base.css'))
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertNotIn('immutable', response['Cache-Control'])
+            response.close()
+
+
+class OrderFieldTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('teacher', password='password')
+        subject = Subject.objects.create(title='Programming', slug='programming')
+        self.course = Course.objects.create(owner=self.owner, subject=subject,
+                                            title='Python', slug='python')
+        self.module = Module.objects.create(course=self.course, title='Module')
+
+    def add_content(self, **kwargs):
+        text = Text.objects.create(owner=self.owner, title='Text', content='Text')
+        return Content.objects.create(module=self.module, item=text, **kwargs)
+
+    def test_after_reorder(self):
+        contents = [self.add_content() for number in range(3)]
+        self.assertEqual([content.order for content in contents], [0, 1, 2])
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('content_order'),
+                                    data={contents[0].id: 3},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.add_content().order, 4)
+        for order in (-1, 2 ** 31):
+            response = self.client.post(reverse('content_order'),
+                                        data={contents[1].id: order},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_after_explicit_orders(self):
+        self.add_content(order=7)
+        self.assertEqual(self.add_content().order, 8)
+        module = Module.objects.create(course=self.course, title='Module', order=5)
+        module.order = 9
+        module.save()
+        self.assertEqual(Module.objects.create(course=self.course, title='Module').order, 10)
+        modules = bulk_create_ordered(Module, [Module(course=self.course, order=12),
+                                               Module(course=self.course)])
+        self.assertEqual(modules[1].order, 13)
+
+    def test_deleted_scopes(self):
+        self.add_content()
+        keys = ['courses.content.order:{}'.format(self.module.id),
+                'courses.module.order:{}'.format(self.course.id)]
+        self.assertEqual(OrderSequence.objects.filter(key__in=keys).count(), 2)
+        # cascades delete the counters of the module and of the course
+        self.course.delete()
+        self.assertFalse(OrderSequence.objects.filter(key__in=keys).exists())
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.owner = User.objects.create_user('teacher', password='password')
+        self.other = User.objects.create_user('student', password='password')
+        subject = Subject.objects.create(title='Programming', slug='programming')
+        self.course = Course.objects.create(owner=self.owner, subject=subject,
+                                            title='Python', slug='python',
+                                            overview='Overview')
+        first = Module.objects.create(course=self.course, title='First',
+                                      description='First', order=3)
+        second = Module.objects.create(course=self.course, title='Second',
+                                       description='Second', order=7)
+        # two files with the same data share a blob
+        blob = blob_storage.save('notes.pdf', ContentFile(b'data'))
+        items = [(first, 2, Text.objects.create(owner=self.owner, title='Text',
+                                                content='Text')),
+                 (first, 5, File.objects.create(owner=self.owner, title='Notes',
+                                                file=blob)),
+                 (second, 0, File.objects.create(owner=self.owner, title='Copy',
+                                                 file=blob))]
+        for module, order, item in items:
+            Content.objects.create(module=module, item=item, order=order)
+
+    def export(self):
+        archive = io.BytesIO()
+        export_course(self.course, archive)
+        return archive.getvalue()
+
+    def outline(self, course):
+        return [(module.title, module.order,
+                 [(content.order, content.item.title, content.item.owner_id)
+                  for content in module.contents.all()])
+                for module in course.modules.all()]
+
+    def test_round_trip(self):
+        course = import_course(io.BytesIO(self.export()), self.other, slug='copy')
+        self.assertEqual(course.slug, 'copy')
+        # orders are kept, contents point to new items of the importing user
+        self.assertEqual(self.outline(course), [
+            ('First', 3, [(2, 'Text', self.other.id), (5, 'Notes', self.other.id)]),
+            ('Second', 7, [(0, 'Copy', self.other.id)])])
+        old_items = set(Content.objects.filter(module__course=self.course)
+                                       .values_list('content_type', 'object_id'))
+        new_items = set(Content.objects.filter(module__course=course)
+                                       .values_list('content_type', 'object_id'))
+        self.assertFalse(old_items & new_items)
+        self.assertEqual(set(File.objects.filter(owner=self.other)
+                                         .values_list('file', flat=True)),
+                         set(File.objects.filter(owner=self.owner)
+                                         .values_list('file', flat=True)))
+
+    def test_broken_archive(self):
+        data = self.export()
+        with self.assertRaisesMessage(TransferError, 'Broken course archive'):
+            import_course(io.BytesIO(data[:len(data) // 2]), self.other, slug='copy')
+        self.assertFalse(Course.objects.filter(owner=self.other).exists())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name, BLOB_GRACE_PERIOD=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.owner = User.objects.create_user('teacher', password='password')
+        self.image = Image.objects.create(owner=self.owner, title='Image',
+                                          image=self.save_png('red'))
+        self.client.force_login(self.owner)
+
+    def save_png(self, color):
+        from PIL import Image as PILImage
+        data = io.BytesIO()
+        PILImage.new('RGB', (400, 300), color).save(data, 'PNG')
+        return blob_storage.save('image.png', ContentFile(data.getvalue()))
+
+    def test_replaced_image(self):
+        storage = ImageDerivative._meta.get_field('file').storage
+        old = derivatives.generate_derivative(self.image.id, 'thumbnail').file.name
+        self.image.image = self.save_png('blue')
+        self.image.save()
+        new = derivatives.generate_derivative(self.image.id, 'thumbnail').file.name
+        self.assertNotEqual(old, new)
+        # the old derivative is collected like released blobs
+        Task.objects.update(run_at=timezone.now())
+        tasks.run_worker(once=True)
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(storage.exists(new))
+
+    @override_settings(IMAGE_DERIVATIVE_TIMEOUT=0)
+    def test_timeout(self):
+        # a derivative still being generated
+        future = Future()
+        derivatives._inflight[self.image.id, 'thumbnail'] = future
+        self.addCleanup(derivatives._inflight.clear)
+        response = self.client.get(reverse('image_derivative',
+                                           args=[self.image.id, 'thumbnail']))
+        self.assertRedirects(response, self.image.image.url,
+                             fetch_redirect_response=False)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('teacher', password='password')
+        subject = Subject.objects.create(title='Programming', slug='programming')
+        self.python = Course.objects.create(owner=owner, subject=subject,
+                                            title='Python basics', slug='python',
+                                            overview='Variables and loops')
+        self.music = Course.objects.create(owner=owner, subject=subject,
+                                           title='Music theory', slug='music',
+                                           overview='Harmony with small python scripts')
+
+    def test_ranking_and_snippet(self):
+        hits = search.search_courses('python')
+        # title matches rank higher
+        self.assertEqual([hit.course for hit in hits], [self.python, self.music])
+        self.assertIn('<b>python</b>', hits[1].snippet)
+        self.assertEqual(search.search_courses('the'), [])
+
+    def test_many_documents_of_one_course(self):
+        Module.objects.bulk_create([Module(course=self.python, order=number,
+                                           title='Python python', description='Python')
+                                    for number in range(30)])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        hits = search.search_courses('python', limit=2)
+        self.assertEqual([hit.course for hit in hits], [self.python, self.music])
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'a@example.com',
+                                                              'password'))
+        url = reverse('admin:courses_course_changelist')
+        # words starting with the term, then LIKE for parts of words
+        for term, courses in (('pyth', [self.python, self.music]),
+                              ('ytho', [self.python, self.music]),
+                              ('harm', [self.music])):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(set(response.context['cl'].result_list), set(courses))
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('uploader', password='password')
+        subject = Subject.objects.create(title='Music', slug='music')
+        course = Course.objects.create(owner=owner, subject=subject,
+                                       title='Course', slug='course')
+        self.module = Module.objects.create(course=course, title='Module')
+        self.client.force_login(owner)
+        for name in ('MEDIA_ROOT', 'CHUNKED_UPLOAD_DIR'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            override = override_settings(**{name: directory.name})
+            override.enable()
+            self.addCleanup(override.disable)
+
+    def start(self, size):
+        response = self.client.post(reverse('module_content_upload',
+                                            args=[self.module.id, 'file']),
+                                    {'title': 'Upload', 'filename': 'a.pdf', 'size': size},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(reverse('chunked_upload', args=[upload_id]), data,
+                               content_type='application/octet-stream',
+                               HTTP_X_UPLOAD_OFFSET=str(offset),
+                               HTTP_X_CHUNK_CHECKSUM=hashlib.sha256(data).hexdigest())
+
+    def test_resumed_upload(self):
+        upload_id = self.start(10)
+        self.assertEqual(self.put(upload_id, 0, b'hello').json()['offset'], 5)
+        # a repeated chunk is refused, the client resumes from the offset
+        self.assertEqual(self.put(upload_id, 0, b'hello').status_code, 409)
+        status = self.client.get(reverse('chunked_upload', args=[upload_id])).json()
+        self.assertEqual(status['offset'], 5)
+        response = self.put(upload_id, status['offset'], b'world')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['id'], upload_id)
+        item = Content.objects.get(id=response.json()['content_id']).item
+        with item.file.open('rb') as f:
+            self.assertEqual(f.read(), b'helloworld')
+        self.assertEqual(os.listdir(uploads.get_upload_dir()), [])
+
+    def test_offset_without_data(self):
+        upload_id = self.start(10)
+        ChunkedUpload.objects.filter(id=upload_id).update(offset=5)
+        self.assertEqual(self.put(upload_id, 5, b'world').status_code, 409)
+        self.assertFalse(Content.objects.exists())
+
+    def test_expired_upload(self):
+        upload_id = self.start(10)
+        self.put(upload_id, 0, b'hello')
+        tasks.run_worker(once=True)
+        self.assertTrue(ChunkedUpload.objects.filter(id=upload_id).exists())
+        ChunkedUpload.objects.filter(id=upload_id).update(
+            updated=timezone.now() - timedelta(seconds=uploads.EXPIRY))
+        Task.objects.update(run_at=timezone.now())
+        tasks.run_worker(once=True)
+        self.assertFalse(ChunkedUpload.objects.filter(id=upload_id).exists())
+        self.assertEqual(os.listdir(uploads.get_upload_dir()), [])
+
+
+# runs of the flaky task per key
+flaky_runs = {}
+
+
+# fails the first "failures" times
+@tasks.task('tests.flaky')
+def flaky_task(key='', failures=0):
+    flaky_runs[key] = flaky_runs.get(key, 0) + 1
+    if flaky_runs[key] <= failures:
+        raise ValueError('Failed')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        flaky_runs.clear()
+
+    def test_enqueue_in_transaction(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                tasks.enqueue('tests.flaky')
+                raise ValueError('Rolled back')
+        self.assertFalse(Task.objects.exists())
+        with self.assertRaises(ValueError):
+            tasks.enqueue('tests.unknown')
+
+    def test_priority_and_lease(self):
+        low = tasks.enqueue('tests.flaky', priority=-1)
+        high = tasks.enqueue('tests.flaky', priority=1)
+        later = tasks.enqueue('tests.flaky', delay=60)
+        claimed = tasks.claim(limit=10, lease=60)
+        self.assertEqual([task.id for task in claimed], [high.id, low.id])
+        self.assertEqual(tasks.claim(limit=10), [])
+        # a worker which died: its tasks are claimed again after the lease
+        Task.objects.filter(id=high.id).update(locked_until=timezone.now())
+        self.assertEqual([task.id for task in tasks.claim()], [high.id])
+        Task.objects.filter(id=later.id).update(run_at=timezone.now())
+        self.assertEqual(tasks.run_worker(once=True), 1)
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)
+                                         .order_by('id')), [low.id, high.id])
+
+    def test_names(self):
+        other = tasks.enqueue('collect_blobs', {'names': []})
+        flaky = tasks.enqueue('tests.flaky')
+        self.assertEqual([task.id for task in tasks.claim(names=['tests.flaky'])],
+                         [flaky.id])
+        self.assertEqual(tasks.run_worker(once=True, names=['tests.flaky']), 0)
+        self.assertEqual(Task.objects.get(id=other.id).status, Task.QUEUED)
+
+    def test_retry_and_failure(self):
+        retried = tasks.enqueue('tests.flaky', {'key': 'retried', 'failures': 1})
+        failed = tasks.enqueue('tests.flaky', {'key': 'failed', 'failures': 10},
+                               max_attempts=1)
+        with self.assertLogs('courses.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_worker(once=True), 2)
+        retried.refresh_from_db()
+        self.assertEqual(retried.status, Task.QUEUED)
+        self.assertIn('ValueError', retried.last_error)
+        self.assertGreater(retried.run_at, timezone.now())
+        self.assertEqual(Task.objects.get(id=failed.id).status, Task.FAILED)
+        Task.objects.filter(id=retried.id).update(run_at=timezone.now())
+        self.assertEqual(tasks.run_worker(once=True), 1)
+        self.assertFalse(Task.objects.filter(id=retried.id).exists())
+
+
+# timing of the most used views, results are written as JSON when
+# COURSES_BENCHMARK_OUTPUT is set; runs use warm caches like production
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class ViewBenchmarks(CatalogTestCase):
+    repeat = int(os.environ.get('COURSES_BENCHMARK_REPEAT', 10))
+    results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ViewBenchmarks, cls).tearDownClass()
+        output = os.environ.get('COURSES_BENCHMARK_OUTPUT')
+        if output:
+            with open(output, 'w') as f:
+                json.dump({'repeat': cls.repeat, 'vendor': connection.vendor,
+                           'results': cls.results}, f, indent=2, sort_keys=True)
+
+    def benchmark(self, name, request):
+        timings = []
+        queries = []
+        for number in range(self.repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request(number)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.assertLess(response.status_code, 400)
+            queries.append(len(context))
+        self.results[name] = {
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+        }
+
+    def test_course_list(self):
+        url = reverse('manage_course_list')
+        self.benchmark('manage_course_list', lambda number: self.client.get(url))
+
+    def test_content_list(self):
+        url = reverse('module_content_list', args=[self.module.id])
+        self.benchmark('module_content_list', lambda number: self.client.get(url))
+
+    def test_reorder(self):
+        contents = list(Content.objects.filter(module=self.module)
+                                       .values_list('id', flat=True))
+        url = reverse('content_order')
+        self.benchmark('content_order', lambda number: self.client.post(
+            url, {'id': contents[-1 - number], 'new_index': number},
+            content_type='application/json'))
+
+    def test_create_content(self):
+        url = reverse('module_content_create', args=[self.module.id, 'text'])
+        self.benchmark('module_content_create', lambda number: self.client.post(
+            url, {'title': 'Text {}'.format(number), 'content': 'Body'}))
+
+    def test_public_catalog(self):
+        url = reverse('course_list')
+        self.client.logout()
+        self.benchmark('course_list', lambda number: self.client.get(url))
@@ -0,0 +1,402 @@
+import json
+import os
+import posixpath
+import tarfile
+import time
+import zlib
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, router, transaction
+from .blobs import blob_fields, release_blobs
+from .models import Subject, Course, Module, Content
+from .registry import registry
+from .storage import blob_storage
+from . import search
+
+
+# course archives: a gzipped tar stream with
+#   manifest.json              course, modules and contents (outline)
+#   blobs/<name>               every file/image blob once
+#   items/<model>-<n>.jsonl    items (text/video/image/file), one per line
+# members are written and read one by one, so neither export nor import
+# keeps the whole course in memory; clone_course copies a course inside
+# the database with the same manifest and bulk inserts
+
+FORMAT = 'educa-course'
+FORMAT_VERSION = 1
+BATCH_SIZE = 500
+# item fields which are not exported, imported items get new values
+SKIPPED_FIELDS = ['id', 'owner', 'created', 'updated']
+
+
+class TransferError(Exception):
+    pass
+
+
+# bulk insert returning primary keys: backends which return ids from
+# INSERT use bulk_create, on SQLite a range of ids is reserved in
+# sqlite_sequence first (the UPDATE takes the write lock, so concurrent
+# imports get other ranges), other backends insert row by row
+def bulk_create_with_ids(model, objs, batch_size=BATCH_SIZE):
+    objs = list(objs)
+    if not objs:
+        return objs
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model._default_manager.using(using) \
+                    .bulk_create(objs, batch_size=batch_size)
+    if connection.vendor != 'sqlite':
+        for obj in objs:
+            obj.save(using=using)
+        return objs
+    with transaction.atomic(using=using):
+        first = reserve_ids(model, len(objs), using)
+        for id, obj in enumerate(objs, first):
+            obj.pk = id
+        model._default_manager.using(using) \
+             .bulk_create(objs, batch_size=batch_size)
+    return objs
+
+
+def reserve_ids(model, count, using):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s',
+                       [count, table])
+        if cursor.rowcount:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                           [table])
+            return cursor.fetchone()[0] - count + 1
+        # nothing was inserted into the table yet
+        cursor.execute('SELECT COALESCE(MAX({}), 0) FROM {}'.format(
+            connection.ops.quote_name(model._meta.pk.column),
+            connection.ops.quote_name(table)))
+        last = cursor.fetchone()[0]
+        cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                       [table, last + count])
+        return last + 1
+
+
+# export
+
+# tar stream compressed on the fly, every method returns the compressed
+# bytes ready to be sent, file data is read and sent in chunks
+class TarStreamWriter(object):
+    def __init__(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def header(self, name, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        return self.compressor.compress(info.tobuf(tarfile.PAX_FORMAT))
+
+    def padding(self, size):
+        remainder = size % tarfile.BLOCKSIZE
+        if not remainder:
+            return b''
+        return self.compressor.compress(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def add_bytes(self, name, data):
+        return self.header(name, len(data)) + \
+            self.compressor.compress(data) + \
+            self.padding(len(data))
+
+    def add_file(self, name, size, chunks):
+        yield self.header(name, size)
+        for chunk in chunks:
+            yield self.compressor.compress(chunk)
+        yield self.padding(size)
+
+    # end of archive marker
+    def close(self):
+        return self.compressor.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2) + \
+            self.compressor.flush()
+
+
+def get_item_fields(model):
+    return [field for field in model._meta.concrete_fields
+            if field.name not in SKIPPED_FIELDS]
+
+
+def build_manifest(course):
+    modules = list(Module.objects.filter(course=course)
+                                 .values('id', 'title', 'description', 'order'))
+    model_names = {ContentType.objects.get_for_model(model).id: name
+                   for name, model in ((name, registry.get_model(name))
+                                       for name in registry.model_names())}
+    contents = [{'module': module_id, 'order': order,
+                 'model_name': model_names[content_type_id], 'item': object_id}
+                for module_id, order, content_type_id, object_id
+                in Content.objects.filter(module__course=course,
+                                          content_type_id__in=model_names)
+                                  .order_by('module__order', 'order')
+                                  .values_list('module_id', 'order',
+                                               'content_type_id', 'object_id')]
+    return {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'course': {
+            'title': course.title,
+            'slug': course.slug,
+            'overview': course.overview,
+            'subject': course.subject.slug,
+        },
+        'modules': modules,
+        'contents': contents,
+    }
+
+
+# chunks of a gzipped archive of the course, for a streaming response
+# or to be written to a file
+def iter_export(course, batch_size=BATCH_SIZE):
+    writer = TarStreamWriter()
+    manifest = build_manifest(course)
+    yield writer.add_bytes('manifest.json',
+                           json.dumps(manifest, cls=DjangoJSONEncoder).encode())
+
+    item_ids = {}
+    for content in manifest['contents']:
+        item_ids.setdefault(content['model_name'], []).append(content['item'])
+
+    # blobs first, the import stores them before the items using them
+    blob_names = set()
+    for model, field_name in blob_fields():
+        ids = item_ids.get(model._meta.model_name, [])
+        for start in range(0, len(ids), batch_size):
+            blob_names.update(model.objects.filter(id__in=ids[start:start + batch_size])
+                                           .values_list(field_name, flat=True))
+    for name in sorted(name for name in blob_names if name):
+        with blob_storage.open(name, 'rb') as f:
+            yield from writer.add_file(posixpath.join('blobs', name), f.size, f.chunks())
+
+    for model_name, ids in item_ids.items():
+        model = registry.get_model(model_name)
+        fields = [field.attname for field in get_item_fields(model)]
+        ids = sorted(set(ids))
+        for number, start in enumerate(range(0, len(ids), batch_size)):
+            lines = [json.dumps({'id': row.pop('id'), 'fields': row},
+                                cls=DjangoJSONEncoder)
+                     for row in model.objects.filter(id__in=ids[start:start + batch_size])
+                                             .values('id', *fields)]
+            yield writer.add_bytes('items/{}-{}.jsonl'.format(model_name, number),
+                                   '\n'.join(lines).encode())
+    yield writer.close()
+
+
+def export_course(course, fileobj):
+    for chunk in iter_export(course):
+        fileobj.write(chunk)
+
+
+# import
+
+def unique_slug(slug):
+    taken = set(Course.objects.filter(slug__startswith=slug)
+                              .values_list('slug', flat=True))
+    candidate = slug
+    number = 1
+    while candidate in taken:
+        number += 1
+        candidate = '{}-{}'.format(slug, number)
+    return candidate
+
+
+def read_json(tar, member):
+    try:
+        return json.loads(tar.extractfile(member).read().decode())
+    except ValueError:
+        raise TransferError('Invalid JSON in {}'.format(member.name))
+
+
+class CourseImporter(object):
+    def __init__(self, owner, subject=None, slug=None, title=None,
+                 batch_size=BATCH_SIZE):
+        self.owner = owner
+        self.subject = subject
+        self.slug = slug
+        self.title = title
+        self.batch_size = batch_size
+        self.manifest = None
+        # archive blob name -> stored blob name
+        self.blobs = {}
+        # (model name, archived id) -> new id
+        self.items = {}
+
+    def read_manifest(self, tar, member):
+        manifest = read_json(tar, member)
+        if manifest.get('format') != FORMAT or \
+                manifest.get('version') != FORMAT_VERSION:
+            raise TransferError('Unsupported archive format')
+        self.manifest = manifest
+
+    def store_blob(self, tar, member):
+        name = member.name[len('blobs/'):]
+        # only the extension of the archived name is used
+        stored = blob_storage.save(os.path.basename(name),
+                                   File(tar.extractfile(member)))
+        self.blobs[name] = stored
+
+    def create_items(self, tar, member):
+        model_name = posixpath.basename(member.name).rsplit('-', 1)[0]
+        model = registry.get_model(model_name)
+        if model is None:
+            raise TransferError('Unknown content type {}'.format(model_name))
+        fields = get_item_fields(model)
+        file_fields = [field.attname for field in fields
+                       if isinstance(field, models.FileField)]
+        data = tar.extractfile(member).read().decode()
+        ids = []
+        objs = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                values = {field.attname: row['fields'][field.attname]
+                          for field in fields}
+            except (ValueError, KeyError, TypeError):
+                raise TransferError('Invalid item in {}'.format(member.name))
+            for attname in file_fields:
+                # files must come with the archive
+                if values[attname] not in self.blobs:
+                    raise TransferError('Missing file {}'.format(values[attname]))
+                values[attname] = self.blobs[values[attname]]
+            obj = model(owner=self.owner, **values)
+            try:
+                obj.full_clean(exclude=['owner'])
+            except ValidationError as e:
+                raise TransferError('Invalid {} {}: {}'.format(model_name, row['id'],
+                                                              '; '.join(e.messages)))
+            ids.append(row['id'])
+            objs.append(obj)
+        bulk_create_with_ids(model, objs, self.batch_size)
+        for id, obj in zip(ids, objs):
+            self.items[model_name, id] = obj.id
+
+    def create_course(self):
+        data = self.manifest['course']
+        subject = self.subject
+        if subject is None:
+            subject = Subject.objects.filter(slug=data['subject']).first()
+            if subject is None:
+                raise TransferError('Unknown subject {}'.format(data['subject']))
+        course = Course(owner=self.owner, subject=subject,
+                        title=self.title or data['title'],
+                        overview=data['overview'],
+                        slug=unique_slug(self.slug or data['slug']))
+        try:
+            course.full_clean()
+        except ValidationError as e:
+            raise TransferError('Invalid course: {}'.format('; '.join(e.messages)))
+        course.save()
+
+        # explicit orders are kept, OrderField only fills missing ones
+        modules = [Module(course=course, title=module['title'],
+                          description=module['description'],
+                          order=module['order'])
+                   for module in self.manifest['modules']]
+        bulk_create_with_ids(Module, modules, self.batch_size)
+        module_ids = {module['id']: obj.id
+                      for module, obj in zip(self.manifest['modules'], modules)}
+
+        content_types = {name: ContentType.objects.get_for_model(registry.get_model(name))
+                         for name in registry.model_names()}
+        contents = []
+        for content in self.manifest['contents']:
+            key = (content['model_name'], content['item'])
+            if content['module'] not in module_ids:
+                raise TransferError('Invalid content {}'.format(content))
+            if key not in self.items:
+                # bound item didn't exist anymore when exported
+                continue
+            contents.append(Content(module_id=module_ids[content['module']],
+                                    content_type=content_types[content['model_name']],
+                                    object_id=self.items[key],
+                                    order=content['order']))
+        Content.objects.bulk_create(contents, batch_size=self.batch_size)
+
+        # bulk inserts send no signals
+        search.reindex('module', module_ids.values())
+        search.reindex('text', [id for (model_name, old_id), id in self.items.items()
+                                if model_name == 'text'])
+        return course
+
+    def run(self, fileobj):
+        try:
+            tar = tarfile.open(fileobj=fileobj, mode='r|*')
+        except tarfile.TarError:
+            raise TransferError('Not a course archive')
+        try:
+            with tar, transaction.atomic():
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    if member.name == 'manifest.json':
+                        self.read_manifest(tar, member)
+                    elif self.manifest is None:
+                        raise TransferError('Archive must start with the manifest')
+                    elif member.name.startswith('blobs/'):
+                        self.store_blob(tar, member)
+                    elif member.name.startswith('items/'):
+                        self.create_items(tar, member)
+                if self.manifest is None:
+                    raise TransferError('Not a course archive')
+                return self.create_course()
+        except (tarfile.TarError, EOFError, zlib.error):
+            release_blobs(self.blobs.values())
+            raise TransferError('Broken course archive')
+        except Exception:
+            # blobs stored for a failed import are checked like any
+            # released blob, the ones used by other items are kept
+            release_blobs(self.blobs.values())
+            raise
+
+
+def import_course(fileobj, owner, subject=None, slug=None):
+    return CourseImporter(owner, subject, slug).run(fileobj)
+
+
+# copy
+
+# copies of items with one read and one bulk insert per batch,
+# files are not copied, the copies use the same blobs
+def copy_items(model, ids, owner, batch_size=BATCH_SIZE):
+    fields = [field.attname for field in get_item_fields(model)]
+    ids = sorted(set(ids))
+    copies = {}
+    for start in range(0, len(ids), batch_size):
+        rows = list(model.objects.filter(id__in=ids[start:start + batch_size])
+                                 .values('id', *fields))
+        objs = [model(owner=owner, **{field: row[field] for field in fields})
+                for row in rows]
+        bulk_create_with_ids(model, objs, batch_size)
+        for row, obj in zip(rows, objs):
+            copies[row['id']] = obj.id
+    return copies
+
+
+# deep copy of a course (e.g. for a new term) with set based queries:
+# modules and contents are read once, items are copied per content type
+# and the copied contents point to the copied items
+def clone_course(course, owner, slug=None, title=None, batch_size=BATCH_SIZE):
+    manifest = build_manifest(course)
+    importer = CourseImporter(owner, subject=course.subject,
+                              slug=slug or course.slug, title=title,
+                              batch_size=batch_size)
+    importer.manifest = manifest
+    item_ids = {}
+    for content in manifest['contents']:
+        item_ids.setdefault(content['model_name'], []).append(content['item'])
+    with transaction.atomic():
+        for model_name, ids in item_ids.items():
+            copies = copy_items(registry.get_model(model_name), ids, owner,
+                                batch_size)
+            importer.items.update(((model_name, id), copy)
+                                  for id, copy in copies.items())
+        return importer.create_course()
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.utils import timezone
+from .derivatives import queue_derivatives
+from .models import ChunkedUpload, Content, Image
+from .registry import registry
+from .tasks import enqueue, task
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# size of chunks suggested to clients and the largest accepted one
+CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+MAX_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024)
+# block size used to copy the request body into the file
+COPY_BLOCK_SIZE = 64 * 1024
+# seconds after the last chunk when an unfinished upload is deleted
+EXPIRY = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', 24 * 60 * 60)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super(UploadError, self).__init__(message)
+        self.status = status
+
+
+# file with the received data, it has temporary_file_path() so
+# FileSystemStorage moves it into place instead of copying it
+class StagedFile(UploadedFile):
+    def __init__(self, path, name, size):
+        super(StagedFile, self).__init__(open(path, 'rb'), name, None, size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+# received chunks are appended to a file in this directory, outside of
+# MEDIA_ROOT so partial files are never served
+def get_upload_dir():
+    return str(getattr(settings, 'CHUNKED_UPLOAD_DIR',
+                       os.path.join(tempfile.gettempdir(), 'educa-chunks')))
+
+
+def staging_path(upload):
+    return os.path.join(get_upload_dir(), str(upload.id))
+
+
+def chain_checksum(previous, chunk_checksum):
+    return hashlib.sha256((previous + chunk_checksum).encode()).hexdigest()
+
+
+# name of the file field of a content model, None for text/video
+def get_file_field(model):
+    for field in model._meta.fields:
+        if isinstance(field, models.FileField):
+            return field.name
+    return None
+
+
+def start_upload(owner, module, model_name, title, filename, size):
+    model = registry.get_model(model_name)
+    if model is None or get_file_field(model) is None:
+        raise UploadError('Content type does not accept files', 404)
+    if size < 0:
+        raise UploadError('Invalid size')
+    upload = ChunkedUpload.objects.create(owner=owner,
+                                          module=module,
+                                          model_name=model_name,
+                                          title=title,
+                                          filename=os.path.basename(filename),
+                                          size=size)
+    os.makedirs(get_upload_dir(), exist_ok=True)
+    open(staging_path(upload), 'wb').close()
+    enqueue('expire_upload', {'upload_id': str(upload.id)}, priority=-1, delay=EXPIRY)
+    return upload
+
+
+# requests for chunks of one upload write one at a time (in every process
+# on this host), a second request waits for the first one
+@contextmanager
+def locked(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# write one chunk read from "stream" at "offset". The data is copied in
+# blocks, compared with the checksum the client sent for this chunk and
+# synced to disk before the range is claimed with a conditional update,
+# so a recorded offset never covers data which isn't in the file
+def write_chunk(upload, offset, stream, length, checksum):
+    if length > MAX_CHUNK_SIZE:
+        raise UploadError('Chunk too large', 413)
+    if offset != upload.offset:
+        raise UploadError('Expected offset {}'.format(upload.offset), 409)
+    if offset + length > upload.size:
+        raise UploadError('Chunk exceeds declared size')
+
+    previous = upload.checksum
+    chained = chain_checksum(previous, checksum)
+    with open(staging_path(upload), 'r+b') as f, locked(f):
+        # received by another request while this one waited for the lock
+        if not ChunkedUpload.objects.filter(id=upload.id, offset=offset).exists():
+            raise UploadError('Chunk already received', 409)
+        # the file holds every claimed range, a shorter one lost data
+        if os.fstat(f.fileno()).st_size < offset:
+            raise UploadError('Received data is missing, start the upload again', 409)
+        digest = hashlib.sha256()
+        remaining = length
+        f.seek(offset)
+        # data after the offset is left from a failed request
+        f.truncate(offset)
+        while remaining:
+            block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            remaining -= len(block)
+        if remaining or digest.hexdigest() != checksum:
+            f.truncate(offset)
+            raise UploadError('Incomplete chunk' if remaining else 'Checksum mismatch')
+        f.flush()
+        os.fsync(f.fileno())
+        claimed = ChunkedUpload.objects.filter(id=upload.id, offset=offset) \
+                                       .update(offset=offset + length,
+                                               checksum=chained,
+                                               updated=timezone.now())
+    if not claimed:
+        raise UploadError('Chunk already received', 409)
+
+    upload.offset = offset + length
+    upload.checksum = chained
+    return upload
+
+
+# validate the whole file with the form of its content type, then create
+# the item and its content in one transaction
+def complete_upload(upload):
+    model = registry.get_model(upload.model_name)
+    Form = registry.get_form_class(upload.model_name)
+    path = staging_path(upload)
+    # all received chunks must be in the file
+    if os.path.getsize(path) != upload.size:
+        raise UploadError('Staged file is incomplete, resume from the offset', 409)
+    staged = StagedFile(path, upload.filename, upload.size)
+    try:
+        form = Form(data={'title': upload.title},
+                    files={get_file_field(model): staged})
+        if not form.is_valid():
+            raise UploadError(form.errors.as_text())
+        with transaction.atomic():
+            obj = form.save(commit=False)
+            obj.owner = upload.owner
+            obj.save()
+            content = Content.objects.create(module=upload.module, item=obj)
+            if isinstance(obj, Image):
+                queue_derivatives(obj)
+            upload.delete()
+    finally:
+        staged.close()
+    if os.path.exists(staged.path):
+        os.remove(staged.path)
+    return content
+
+
+def abort_upload(upload):
+    path = staging_path(upload)
+    upload.delete()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# queued when an upload starts: unfinished uploads without a chunk during
+# the expiry are deleted with their staged file, others are checked again
+@task('expire_upload')
+def expire_upload(upload_id):
+    upload = ChunkedUpload.objects.filter(id=upload_id).first()
+    if upload is None:
+        return
+    expires = upload.updated + timedelta(seconds=EXPIRY)
+    if expires <= timezone.now():
+        abort_upload(upload)
+    else:
+        enqueue('expire_upload', {'upload_id': upload_id}, priority=-1,
+                delay=(expires - timezone.now()).total_seconds())
@@ -3,6 +3,12 @@ from . import views
 
 
 urlpatterns = [
+    # public course page, first and under its own prefix so no slug
+    # (e.g. "mine" or "edit") is taken by a management view
+    path('catalog/<slug:slug>/',
+         views.CourseDetailView.as_view(),
+         name='course_detail'),
+
     # manage courses
     path('mine/',
          views.ManageCourseListView.as_view(),
@@ -20,6 +26,18 @@ urlpatterns = [
          views.CourseDeleteView.as_view(),
          name='course_delete'),
 
+    path('<pk>/export/',
+         views.CourseExportView.as_view(),
+         name='course_export'),
+
+    path('<pk>/clone/',
+         views.CourseCloneView.as_view(),
+         name='course_clone'),
+
+    path('import/',
+         views.CourseImportView.as_view(),
+         name='course_import'),
+
     path('<pk>/module/',
          views.CourseModuleUpdateView.as_view(),
          name='course_module_update'),
@@ -29,6 +47,15 @@ urlpatterns = [
          views.ContentCreateUpdateView.as_view(),
          name='module_content_create'),
 
+    # upload files and images in chunks
+    path('module/<int:module_id>/content/<model_name>/upload/',
+         views.ChunkedUploadStartView.as_view(),
+         name='module_content_upload'),
+
+    path('upload/<uuid:upload_id>/',
+         views.ChunkedUploadView.as_view(),
+         name='chunked_upload'),
+
     path('module/<int:module_id>/content/<model_name>/<id>/',
          views.ContentCreateUpdateView.as_view(),
 
@@ -42,6 +69,10 @@ urlpatterns = [
          views.ModuleContentListView.as_view(),
          name='module_content_list'),
 
+    path('image/<int:image_id>/<variant>/',
+         views.ImageDerivativeView.as_view(),
+         name='image_derivative'),
+
     path('module/order/',
          views.ModuleOrderView.as_view(),
          name='module_order'),
@@ -49,4 +80,26 @@ urlpatterns = [
     path('content/order/',
          views.ContentOrderView.as_view(),
          name='content_order'),
+
+    # async versions of views above, for ASGI servers
+    path('async/mine/',
+         views.AsyncManageCourseListView.as_view(),
+         name='manage_course_list_async'),
+
+    path('async/content/<int:module_id>/',
+         views.AsyncModuleContentListView.as_view(),
+         name='module_content_list_async'),
+
+    path('async/module/order/',
+         views.AsyncModuleOrderView.as_view(),
+         name='module_order_async'),
+
+    path('async/content/order/',
+         views.AsyncContentOrderView.as_view(),
+         name='content_order_async'),
+
+    # public catalog
+    path('subject/<slug:subject>/',
+         views.CourseListView.as_view(),
+         name='course_list_subject'),
 ]
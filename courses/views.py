@@ -1,15 +1,44 @@
+import asyncio
+import json
+import functools
+from concurrent import futures
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.views.generic.base import TemplateResponseMixin, View
 from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from .models import Course
-from .forms import ModuleFormSet
-from django.forms.models import modelform_factory
-from django.apps import apps
+from .models import Subject, Course
+from .forms import ModuleFormSet, VersionConflict, CourseImportForm, CourseCloneForm
+from .pagination import KeysetPaginator
+from .ordering import reorder
+from .registry import registry
+from .models import ChunkedUpload, Image
+from .derivatives import get_derivative, queue_derivatives, VARIANTS
+from .deletion import delete_contents, delete_courses
+from .transfer import (TransferError, clone_course, import_course,
+                       iter_export, unique_slug)
+from . import uploads
+from .catalog import get_catalog_modified, get_catalog_version
+from .ownership import get_ownership
+from .db import read_to_async
+from .outline import (get_course_outline, invalidate_course_outline,
+                      invalidate_module_outline)
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils.decorators import classonlymethod
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag
 from .models import Module, Content
-from braces.views import CsrfExemptMixin, JSONRequestResponseMixin
+from braces.views import CsrfExemptMixin, JSONRequestResponseMixin, JSONResponseMixin
 
 
 # use Mixins to add additional functions for classes using views
@@ -54,6 +83,20 @@ class OwnerCourseEditMixin(OwnerCourseMixin,
 # list courses
 class ManageCourseListView(OwnerCourseMixin, ListView):
     template_name = 'courses/manage/course/list.html'
+    paginate_by = 20
+
+    # module count and first module come with the courses as annotations
+    def get_queryset(self):
+        qs = super(ManageCourseListView, self).get_queryset()
+        return qs.with_module_summary()
+
+    # keyset pagination on "-created", the page is selected by the cursor
+    # of the last course from the previous page instead of its number
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get('after'))
+        return (paginator, page, page.object_list,
+                page.has_next() or page.has_previous())
 
 
 # create new course object
@@ -79,16 +122,115 @@ class CourseDeleteView(PermissionRequiredMixin,
     success_url = reverse_lazy('manage_course_list')
     permission_required = 'courses.delete_course'
 
+    # modules, contents and items bound to them are deleted with batched queries
+    # items are not deleted by the ORM cascade because of the generic relation,
+    # items and their files are deleted by a task after the response
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        delete_courses(Course.objects.filter(id=self.object.id), defer_items=True)
+        return redirect(self.get_success_url())
+
+
+# download the course as an archive, generated while it is sent
+class CourseExportView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        course = get_object_or_404(Course.objects.select_related('subject'),
+                                   id=pk,
+                                   owner=request.user)
+        response = StreamingHttpResponse(iter_export(course),
+                                         content_type='application/gzip')
+        response['Content-Disposition'] = \
+            'attachment; filename="{}.tar.gz"'.format(course.slug)
+        return response
+
+
+# create a course of the current user from an uploaded archive
+class CourseImportView(PermissionRequiredMixin,
+                       LoginRequiredMixin,
+                       TemplateResponseMixin,
+                       View):
+    template_name = 'courses/manage/course/import.html'
+    permission_required = 'courses.add_course'
+
+    def get(self, request):
+        return self.render_to_response({'form': CourseImportForm()})
+
+    def post(self, request):
+        form = CourseImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                import_course(form.cleaned_data['archive'], request.user,
+                              subject=form.cleaned_data['subject'],
+                              slug=form.cleaned_data['slug'])
+                return redirect('manage_course_list')
+            except TransferError as e:
+                form.add_error('archive', str(e))
+        return self.render_to_response({'form': form})
+
+
+# copy a course with its modules, contents and items (e.g. for a new term)
+class CourseCloneView(PermissionRequiredMixin,
+                      LoginRequiredMixin,
+                      TemplateResponseMixin,
+                      View):
+    template_name = 'courses/manage/course/clone.html'
+    permission_required = 'courses.add_course'
+
+    def get_course(self):
+        return get_object_or_404(Course.objects.select_related('subject'),
+                                 id=self.kwargs['pk'],
+                                 owner=self.request.user)
+
+    def get(self, request, pk):
+        course = self.get_course()
+        form = CourseCloneForm(initial={'title': course.title,
+                                        'slug': unique_slug(course.slug)})
+        return self.render_to_response({'course': course, 'form': form})
+
+    def post(self, request, pk):
+        course = self.get_course()
+        form = CourseCloneForm(request.POST)
+        if form.is_valid():
+            clone = clone_course(course, request.user,
+                                 slug=form.cleaned_data['slug'],
+                                 title=form.cleaned_data['title'])
+            return redirect('course_edit', clone.id)
+        return self.render_to_response({'course': course, 'form': form})
+
 
 # this view handles the collection of forms for added, update or delete modules for current course
 # TemplateResponseMixin generate forms and send back HTTP request
 class CourseModuleUpdateView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/formset.html'
     course = None
-
-    # create set of forms
-    def get_formset(self, data=None):
-        return ModuleFormSet(instance=self.course, data=data)
+    page = None
+
+    # page of module ids from the "page" parameter, it's kept in the form action
+    def get_page(self):
+        paginator = Paginator(self.course.modules.values_list('id', flat=True),
+                              settings.MODULE_FORMSET_PAGE_SIZE)
+        return paginator.get_page(self.request.GET.get('page'))
+
+    # create set of forms, courses with many modules are edited page by page
+    # (MODULE_FORMSET_PAGE_SIZE), empty forms for new modules are on the last page
+    def get_formset(self, data=None, conflict=False):
+        modules = self.course.modules.all()
+        if data is not None:
+            # the modules of the sent forms, other editors could have
+            # added or removed modules since the page was shown
+            total = data.get('modules-INITIAL_FORMS', '')
+            ids = [data.get('modules-{}-id'.format(number))
+                   for number in range(int(total) if total.isdigit() else 0)]
+            modules = modules.filter(id__in=[id for id in ids if id and id.isdigit()])
+        else:
+            # the formset filters its queryset, so the page is selected by ids
+            self.page = self.get_page()
+            modules = modules.filter(id__in=list(self.page.object_list))
+        formset = ModuleFormSet(instance=self.course, data=data, queryset=modules,
+                                conflict=conflict)
+        if self.page is not None and self.page.has_next():
+            formset.extra = 0
+        return formset
 
     # get HTTP request and handle the type of request (depends it is GET or POST)
     def dispatch(self, request, pk):
@@ -102,49 +244,57 @@ class CourseModuleUpdateView(TemplateResponseMixin, View):
     def get(self, request, *args, **kwargs):
         formset = self.get_formset()
         return self.render_to_response({'course': self.course,
-                                        'formset': formset})
+                                        'formset': formset,
+                                        'page_obj': self.page})
 
     # for POST request, at first is built ModuleFormSet element, later the method is_valid() is executed
+    # only changed, new and deleted modules are written, a module saved by
+    # another editor in the meantime is a conflict and nothing is saved
     def post(self, request, *args, **kwargs):
         formset = self.get_formset(data=request.POST)
         if formset.is_valid():
-            formset.save()
-            return redirect('manage_course_list')
+            try:
+                formset.save()
+            except VersionConflict:
+                # validated again with the current versions of the modules
+                formset = self.get_formset(data=request.POST, conflict=True)
+                formset.is_valid()
+            else:
+                return redirect('manage_course_list')
+        # the forms are shown again with the links of their page
         return self.render_to_response({'course': self.course,
-                                        'formset': formset})
+                                        'formset': formset,
+                                        'page_obj': self.get_page()})
 
 
 # class can handle create/update form for any type of content
 # one form for multiple types
 class ContentCreateUpdateView(TemplateResponseMixin, View):
-    module = None
+    module_id = None
     model = None
     obj = None
     template_name = 'courses/manage/content/form.html'
 
-    # check if model is from available list, next, using django.apps we get properly class name
+    # check if model is from available list, models are registered in the content registry
     def get_model(self, model_name):
-        if model_name in ['text', 'video', 'image', 'file']:
-            return apps.get_model(app_label='courses',
-                                  model_name=model_name)
-        return None
+        return registry.get_model(model_name)
 
-    # here, we dynamically build a form using modelform_factory()
-    # using exclude, we excluding fields what we don't contain in form, another one will be added automatically
+    # form classes are built once with modelform_factory() when the model is registered
+    # owner, order, created and updated fields are excluded from them
     def get_form(self, model, *args, **kwargs):
-        Form = modelform_factory(model, exclude=['owner',
-                                                 'order',
-                                                 'created',
-                                                 'updated'])
+        Form = registry.get_form_class(model._meta.model_name)
         return Form(*args, **kwargs)
 
     # gets URL parameters and contain as class attributes
     # id None means create new object object
+    # the module is checked in the cached ownership of the user, not loaded
     def dispatch(self, request, module_id, model_name, id=None):
-        self.module = get_object_or_404(Module,
-                                       id=module_id,
-                                       course__owner=request.user)
+        if not get_ownership(request.user).owns_module(module_id):
+            raise Http404('Module not found')
+        self.module_id = module_id
         self.model = self.get_model(model_name)
+        if self.model is None:
+            raise Http404('Unknown content type')
         if id:
             self.obj = get_object_or_404(self.model,
                                          id=id,
@@ -162,62 +312,443 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
                              data=request.POST,
                              files=request.FILES)
         if form.is_valid():
-            obj = form.save(commit=False)
-            obj.owner = request.user
-            obj.save()
-            if not id:
-                # new content
-                Content.objects.create(module=self.module,
-                                       item=obj)
-            return redirect('module_content_list', self.module.id)
+            # tasks are queued with the item, workers see them on commit
+            with transaction.atomic():
+                obj = form.save(commit=False)
+                obj.owner = request.user
+                obj.save()
+                if not id:
+                    # new content
+                    Content.objects.create(module_id=self.module_id,
+                                           item=obj)
+                if isinstance(obj, Image):
+                    # variants are rendered by a worker, not on the first view
+                    queue_derivatives(obj)
+            return redirect('module_content_list', self.module_id)
 
         return self.render_to_response({'form': form,
                                         'object': self.obj})
 
 
+# start a chunked upload of a file or image, the client sends
+# {"title": ..., "filename": ..., "size": ...} and gets the upload id
+class ChunkedUploadStartView(LoginRequiredMixin,
+                             JSONRequestResponseMixin,
+                             View):
+    def post(self, request, module_id, model_name):
+        module = get_object_or_404(Module,
+                                   id=module_id,
+                                   course__owner=request.user)
+        data = self.request_json or {}
+        try:
+            upload = uploads.start_upload(request.user,
+                                          module,
+                                          model_name,
+                                          str(data['title']),
+                                          str(data['filename']),
+                                          int(data['size']))
+        except (KeyError, TypeError, ValueError):
+            return self.render_bad_request_response(
+                {'error': 'title, filename and size are required'})
+        except uploads.UploadError as e:
+            return self.render_json_response({'error': str(e)}, status=e.status)
+        return self.render_json_response({'id': upload.id,
+                                          'offset': upload.offset,
+                                          'chunk_size': uploads.CHUNK_SIZE},
+                                         status=201)
+
+
+# receive chunks of an upload, every chunk is a PUT with the raw data as body
+# and X-Upload-Offset / X-Chunk-Checksum (sha256) headers
+# GET returns the current offset, so an interrupted upload can be resumed
+class ChunkedUploadView(LoginRequiredMixin,
+                        JSONResponseMixin,
+                        View):
+    upload = None
+
+    def dispatch(self, request, upload_id):
+        if request.user.is_authenticated:
+            self.upload = get_object_or_404(ChunkedUpload.objects.select_related('module'),
+                                            id=upload_id,
+                                            owner=request.user)
+        return super(ChunkedUploadView, self).dispatch(request, upload_id)
+
+    def get_status(self, **kwargs):
+        status = {'id': self.upload.id,
+                  'offset': self.upload.offset,
+                  'size': self.upload.size,
+                  'checksum': self.upload.checksum}
+        status.update(kwargs)
+        return status
+
+    def get(self, request, upload_id):
+        return self.render_json_response(self.get_status())
+
+    def put(self, request, upload_id):
+        try:
+            offset = int(request.META['HTTP_X_UPLOAD_OFFSET'])
+            checksum = request.META['HTTP_X_CHUNK_CHECKSUM'].lower()
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return self.render_json_response(
+                {'error': 'X-Upload-Offset and X-Chunk-Checksum are required'},
+                status=400)
+        try:
+            if length:
+                uploads.write_chunk(self.upload, offset, request, length, checksum)
+            if self.upload.offset == self.upload.size:
+                # before the upload row is deleted
+                status = self.get_status()
+                content = uploads.complete_upload(self.upload)
+                status['content_id'] = content.id
+                return self.render_json_response(status, status=201)
+        except uploads.UploadError as e:
+            return self.render_json_response(self.get_status(error=str(e)),
+                                             status=e.status)
+        return self.render_json_response(self.get_status())
+
+    def delete(self, request, upload_id):
+        uploads.abort_upload(self.upload)
+        return self.render_json_response({'deleted': 'OK'})
+
+
+# redirect to a resized version of an image, it is generated on first request
+# the target file has a hashed name and can be cached forever, the redirect only briefly
+class ImageDerivativeView(LoginRequiredMixin, View):
+
+    def get(self, request, image_id, variant):
+        if variant not in VARIANTS:
+            raise Http404('Unknown variant')
+        # images of other instructors are not found (nor rendered)
+        image = get_object_or_404(Image, id=image_id, owner=request.user)
+        try:
+            derivative = get_derivative(image, variant,
+                                        timeout=settings.IMAGE_DERIVATIVE_TIMEOUT)
+        except futures.TimeoutError:
+            # still generated by the pool, the original image meanwhile
+            response = redirect(image.image.url)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        response = redirect(derivative.file.url)
+        patch_cache_control(response, private=True, max_age=300)
+        return response
+
+
 # with this class we can easily delete content from module
 class ContentDeleteView(View):
 
     def post(self, request, id):
-        content = get_object_or_404(Content,
-                                    id=id,
-                                    module__course__owner=request.user)
-        module = content.module
-        content.item.delete()
-        content.delete()
-        return redirect('module_content_list', module.id)
+        contents = Content.objects.filter(id=id)
+        module_id = get_object_or_404(contents.values_list('module_id', flat=True))
+        if not get_ownership(request.user).owns_module(module_id):
+            raise Http404('Content not found')
+        # the item and its files are deleted by a task
+        delete_contents(contents, defer_items=True)
+        return redirect('module_content_list', module_id)
 
 
 # get an Module object by id for current user and generate template with module data
+# modules and contents come from the cached course outline
 class ModuleContentListView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/content_list.html'
 
     def get(self, request, module_id):
-        module = get_object_or_404(Module,
-                                   id=module_id,
-                                   course__owner=request.user)
+        course_id = get_ownership(request.user).get_module_course_id(module_id)
+        if course_id is None:
+            raise Http404('Module not found')
+        outline = get_course_outline(course_id)
+        module = outline.get_module(module_id)
+        if module is None:
+            raise Http404('Module not found')
+        return self.render_to_response({'course': outline.course,
+                                        'modules': outline.modules,
+                                        'module': module})
+
+
+# common part of order views, new positions are applied with one bulk update
+# accepts {id: order, ...} or a compact move {"id": id, "new_index": index}
+class OrderMixin(CsrfExemptMixin,
+                 JSONRequestResponseMixin):
+    scope_field = None
 
-        return self.render_to_response({'module': module})
+    def get_queryset(self):
+        raise NotImplementedError
 
+    # scopes (courses or modules) of the reordered objects must be owned
+    def check_scopes(self, scopes):
+        raise NotImplementedError
+
+    # bulk updates don't send signals, cached outlines are dropped here
+    def invalidate(self, scopes):
+        raise NotImplementedError
 
-# get and change module position in list (using JSON file)
-class ModuleOrderView(CsrfExemptMixin,
-                      JSONRequestResponseMixin,
-                      View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id,
-                                  course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        try:
+            changed, scopes = reorder(self.get_queryset(),
+                                      self.request_json,
+                                      self.scope_field,
+                                      check_scopes=self.check_scopes)
+        except ValueError:
+            return self.render_bad_request_response(
+                {'error': 'Invalid order request'})
+        except PermissionDenied:
+            return self.render_json_response({'error': 'Forbidden'},
+                                             status=403)
+        if changed:
+            self.invalidate(scopes)
+        return self.render_json_response({'saved': 'OK',
+                                          'updated': len(changed)})
+
+
+# get and change module position in list (using JSON file)
+class ModuleOrderView(OrderMixin, View):
+    scope_field = 'course'
+
+    def get_queryset(self):
+        return Module.objects.all()
+
+    def check_scopes(self, scopes):
+        return get_ownership(self.request.user).owns_courses(scopes)
+
+    def invalidate(self, scopes):
+        invalidate_course_outline(scopes)
 
 
 # get and change content position in list (using JSON file)
-class ContentOrderView(CsrfExemptMixin,
-                       JSONRequestResponseMixin,
-                       View):
-    def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id,
-                                   module__course__owner=request.user) \
-                       .update(order=order)
-        return self.render_json_response({'saved': 'OK'})
\ No newline at end of file
+class ContentOrderView(OrderMixin, View):
+    scope_field = 'module'
+
+    def get_queryset(self):
+        return Content.objects.all()
+
+    def check_scopes(self, scopes):
+        return get_ownership(self.request.user).owns_modules(scopes)
+
+    def invalidate(self, scopes):
+        invalidate_module_outline(scopes)
+
+
+# public catalog, built for read-heavy traffic: pages have an ETag and
+# Last-Modified, a conditional GET is answered with 304 before any template
+# is rendered and Cache-Control lets a reverse proxy keep anonymous pages
+class ConditionalCacheMixin(object):
+    max_age = getattr(settings, 'CATALOG_MAX_AGE', 60)
+    s_maxage = getattr(settings, 'CATALOG_S_MAXAGE', 300)
+
+    def get_etag(self):
+        return None
+
+    def get_last_modified(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super(ConditionalCacheMixin, self).dispatch(request, *args, **kwargs)
+        # pages show if the user is signed in, both versions have own etags
+        etag = self.get_etag()
+        if etag is not None:
+            etag = quote_etag('{}-{}'.format(
+                etag, 'user' if request.user.is_authenticated else 'anon'))
+        last_modified = self.get_last_modified()
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalCacheMixin, self).dispatch(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        if etag is not None and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified is not None and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, max_age=0,
+                                must_revalidate=True)
+        else:
+            patch_cache_control(response, public=True, max_age=self.max_age,
+                                s_maxage=self.s_maxage)
+        return response
+
+
+# list of subjects with courses of all subjects or the selected one
+# subject list and course list are cached fragments, their keys contain
+# the catalog version, so changes don't wait for them to expire
+class CourseListView(ConditionalCacheMixin, TemplateResponseMixin, View):
+    template_name = 'courses/course/list.html'
+    paginate_by = 20
+
+    def get_etag(self):
+        return 'catalog-{}'.format(get_catalog_version())
+
+    def get_last_modified(self):
+        return get_catalog_modified()
+
+    def get(self, request, subject=None):
+        subjects = Subject.objects.annotate(total_courses=Count('courses'))
+        courses = Course.objects.select_related('subject', 'owner') \
+                                .annotate(total_modules=Count('modules'))
+        if subject:
+            subject = get_object_or_404(Subject, slug=subject)
+            courses = courses.filter(subject=subject)
+        paginator = KeysetPaginator(courses, self.paginate_by)
+        cursor = request.GET.get('after')
+        return self.render_to_response({
+            'subjects': subjects,
+            'subject': subject,
+            # only queried when the cached fragment is missing
+            'page_obj': SimpleLazyObject(lambda: paginator.page(cursor)),
+            'cursor': cursor or '',
+            'catalog_version': get_catalog_version(),
+            'fragment_timeout': getattr(settings, 'CATALOG_FRAGMENT_TIMEOUT', 300),
+        })
+
+
+# course with its modules, from the cached course outline
+class CourseDetailView(ConditionalCacheMixin, TemplateResponseMixin, View):
+    template_name = 'courses/course/detail.html'
+    outline = None
+
+    def get_outline(self):
+        if self.outline is None:
+            course_id = get_object_or_404(Course.objects.values_list('id', flat=True),
+                                          slug=self.kwargs['slug'])
+            self.outline = get_course_outline(course_id)
+        return self.outline
+
+    def get_etag(self):
+        return self.get_outline().etag
+
+    def get_last_modified(self):
+        return self.get_outline().modified
+
+    def get(self, request, slug):
+        outline = self.get_outline()
+        return self.render_to_response({'course': outline.course,
+                                        'modules': outline.modules})
+
+
+# async versions of the read-heavy views and JSON endpoints, for ASGI servers
+# queries run in a thread with sync_to_async: reads with read_to_async (in
+# parallel), writes with their transaction in the thread sensitive thread
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+# base class of async views: handlers are coroutines and the user is
+# loaded in a thread before the ownership checks
+class AsyncView(View):
+    login_required = True
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncView, cls).as_view(**initkwargs)
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        is_authenticated = await read_to_async(lambda: request.user.is_authenticated)()
+        if self.login_required and not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), None)
+            if handler is not None:
+                # inherited handlers (options) are not coroutines
+                response = handler(request, *args, **kwargs)
+                if asyncio.iscoroutine(response):
+                    response = await response
+                return response
+        return self.http_method_not_allowed(request, *args, **kwargs)
+
+
+# async version of ManageCourseListView
+class AsyncManageCourseListView(AsyncView):
+    template_name = 'courses/manage/course/list.html'
+    paginate_by = ManageCourseListView.paginate_by
+
+    async def get(self, request):
+        qs = Course.objects.filter(owner=request.user).with_module_summary()
+        paginator = KeysetPaginator(qs, self.paginate_by)
+        page = await paginator.apage(request.GET.get('after'))
+        return TemplateResponse(request, self.template_name,
+                                {'object_list': page.object_list,
+                                 'course_list': page.object_list,
+                                 'paginator': paginator,
+                                 'page_obj': page,
+                                 'is_paginated': page.has_next() or page.has_previous()})
+
+
+# async version of ModuleContentListView
+class AsyncModuleContentListView(AsyncView):
+    template_name = ModuleContentListView.template_name
+
+    async def get(self, request, module_id):
+        ownership = await read_to_async(get_ownership)(request.user)
+        course_id = await read_to_async(ownership.get_module_course_id)(module_id)
+        if course_id is None:
+            raise Http404('Module not found')
+        outline = await read_to_async(get_course_outline)(course_id)
+        module = outline.get_module(module_id)
+        if module is None:
+            raise Http404('Module not found')
+        return TemplateResponse(request, self.template_name,
+                                {'course': outline.course,
+                                 'modules': outline.modules,
+                                 'module': module})
+
+
+# async version of OrderMixin, the reorder runs in one thread because
+# it uses a transaction
+class AsyncOrderMixin(object):
+    scope_field = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncOrderMixin, cls).as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def check_scopes(self, scopes):
+        raise NotImplementedError
+
+    def invalidate(self, scopes):
+        raise NotImplementedError
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            data = None
+        try:
+            changed, scopes = await sync_to_async(reorder)(self.get_queryset(),
+                                                           data,
+                                                           self.scope_field,
+                                                           check_scopes=self.check_scopes)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid order request'}, status=400)
+        except PermissionDenied:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        if changed:
+            await sync_to_async(self.invalidate)(scopes)
+        return JsonResponse({'saved': 'OK', 'updated': len(changed)})
+
+
+class AsyncModuleOrderView(AsyncOrderMixin, AsyncView):
+    scope_field = ModuleOrderView.scope_field
+    get_queryset = ModuleOrderView.get_queryset
+    check_scopes = ModuleOrderView.check_scopes
+    invalidate = ModuleOrderView.invalidate
+
+
+class AsyncContentOrderView(AsyncOrderMixin, AsyncView):
+    scope_field = ContentOrderView.scope_field
+    get_queryset = ContentOrderView.get_queryset
+    check_scopes = ContentOrderView.check_scopes
+    invalidate = ContentOrderView.invalidate
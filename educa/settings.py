@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,7 +33,7 @@ ALLOWED_HOSTS = []
 
 INSTALLED_APPS = [
     # import projects apps
-    'courses',
+    'courses.apps.CoursesConfig',
 
     
     # default django apps
@@ -45,7 +46,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it measures the other middleware too
+    'courses.middleware.RequestMetricsMiddleware',
+    # reads of a request go to replicas until it writes
+    'courses.db.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # static files are answered before sessions and auth are loaded
+    'courses.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +86,108 @@ WSGI_APPLICATION = 'educa.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# seconds a connection waits for a lock held by another writer
+SQLITE_LOCK_TIMEOUT = 20
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # connections are kept for the next requests and checked before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_LOCK_TIMEOUT,
+        },
     }
 }
 
+# applied to every new SQLite connection (see courses.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    # milliseconds, the same wait as the connection timeout
+    'busy_timeout': SQLITE_LOCK_TIMEOUT * 1000,
+}
+
+# read replicas, e.g. EDUCA_DB_REPLICAS=2 adds aliases replica1 and replica2;
+# with SQLite they open the same file (WAL readers), other backends would
+# point them at real replicas. Reads of DATABASE_ROUTER_APPS models go to them
+for number in range(1, int(os.environ.get('EDUCA_DB_REPLICAS', 0)) + 1):
+    DATABASES['replica{}'.format(number)] = dict(DATABASES['default'],
+                                                 TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTER_APPS = ['courses']
+DATABASE_ROUTERS = ['courses.db.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# locmem is per process, with more worker processes use a shared backend
+# e.g. 'django.core.cache.backends.filebased.FileBasedCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'educa',
+        'OPTIONS': {
+            # the default of 300 entries is less than the item fragments
+            # of one big module, culling would drop outlines too
+            'MAX_ENTRIES': 20000,
+        },
+    }
+}
+
+# how long (seconds) course outlines are kept in cache
+COURSE_OUTLINE_TIMEOUT = 60 * 60
+# rendered items (courses.fragments), keys change when items are saved
+ITEM_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# request metrics (courses.middleware): share of requests measured, 0 turns
+# the middleware off (set e.g. 1.0 locally to profile views); queries
+# repeated this many times are reported
+REQUEST_METRICS_SAMPLE_RATE = 0
+REQUEST_METRICS_DUPLICATE_THRESHOLD = 3
+REQUEST_METRICS_SERVER_TIMING = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'courses.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# public catalog: Cache-Control max-age for browsers and shared caches
+# (reverse proxies) and how long fragments of catalog pages are cached
+CATALOG_MAX_AGE = 60
+CATALOG_S_MAXAGE = 300
+CATALOG_FRAGMENT_TIMEOUT = 60 * 15
+
+# modules edited on one page of the course module formset
+MODULE_FORMSET_PAGE_SIZE = 50
+
+# resolved permissions of users are cached (see courses.backends) like the
+# course and module ids owned by users (see courses.ownership)
+AUTHENTICATION_BACKENDS = ['courses.backends.CachedModelBackend']
+PERMISSIONS_CACHE_TIMEOUT = 5 * 60
+# request.user of sessions is loaded from cache (courses.backends)
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
+# sessions are read from cache and written to cache and database only
+# when their data changed (courses.sessions)
+SESSION_ENGINE = 'courses.sessions'
+OWNERSHIP_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -124,3 +226,44 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+# collectstatic copies files here with hashed names and .gz/.br variants,
+# courses.middleware.StaticFilesMiddleware serves them
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATICFILES_STORAGE = 'courses.storage.CompressedManifestStaticFilesStorage'
+# Cache-Control max-age of static files without hashed names
+STATIC_MAX_AGE = 60
+
+
+# Media files (uploaded files and images)
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# uploaded files are hashed while they are received (for courses.storage)
+FILE_UPLOAD_HANDLERS = [
+    'courses.storage.HashingMemoryFileUploadHandler',
+    'courses.storage.HashingTemporaryFileUploadHandler',
+]
+
+# shared file blobs used or created in the last seconds are never deleted
+BLOB_GRACE_PERIOD = 60
+# seconds a request waits for an image derivative being generated, the
+# original image is sent after that
+IMAGE_DERIVATIVE_TIMEOUT = 5
+
+# background tasks (courses.tasks) run by "manage.py run_tasks": seconds a
+# claimed task is leased to a worker, before the first retry (doubled by
+# every attempt) and between polls of an empty queue
+TASK_LEASE = 5 * 60
+TASK_RETRY_DELAY = 30
+TASK_MAX_ATTEMPTS = 3
+TASK_BATCH_SIZE = 10
+TASK_POLL_INTERVAL = 1
+
+# chunked uploads of files and images (bytes)
+CHUNKED_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# partial files are staged outside of MEDIA_ROOT (default: a directory in
+# the system temp dir, set CHUNKED_UPLOAD_DIR to change it) and deleted
+# with their upload when no chunk came for this many seconds
+CHUNKED_UPLOAD_EXPIRY = 24 * 60 * 60